@@ -0,0 +1,92 @@
+import hashlib
+from datetime import datetime
+from flask import Response, jsonify, request
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, load_only
+from models import db, User, Machine
+from machine_import import MACHINE_FIELDS
+
+# Read-only JSON API (/api/v1/...) for the mobile app and partners.
+# Responses are compact JSON; `?fields=a,b` limits each machine to those
+# fields (id is always included) and only those columns are loaded.
+#
+# Every response carries a weak ETag computed from a cheap stamp query run
+# before anything else: the highest machine id and updated_at for catalog
+# responses (new machines raise the id, edits raise updated_at), or the
+# machine's updated_at and its supplier's profile version for a detail
+# response. A request whose If-None-Match matches gets a 304 without the
+# page query or serialization running.
+
+API_VERSION = 'v1'
+
+API_FIELDS = ['id', 'supplier_id'] + MACHINE_FIELDS + [
+    'price_min', 'price_max', 'power_kw', 'capacity_per_shift', 'created_at', 'updated_at']
+LIST_FIELDS = ['id', 'name', 'category', 'use_case', 'price_range', 'image_front', 'supplier_id', 'created_at']
+SUPPLIER_FIELDS = ['id', 'name', 'company_name', 'city']
+
+def api_error(status, message):
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+def parse_fields(requested, default, allowed):
+    """Return the field list for `?fields=`, or None if it names an unknown field"""
+    if not requested:
+        return default
+    fields = ['id'] + [field.strip() for field in requested.split(',') if field.strip() and field.strip() != 'id']
+    if any(field not in allowed for field in fields):
+        return None
+    return list(dict.fromkeys(fields))
+
+def load_columns(fields):
+    """Query options loading only the columns `fields` need"""
+    options = [load_only(*[getattr(Machine, field) for field in fields if field in API_FIELDS])]
+    if 'supplier' in fields:
+        options.append(joinedload(Machine.supplier).load_only(*[getattr(User, field) for field in SUPPLIER_FIELDS]))
+    return options
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def machine_json(machine, fields):
+    data = {field: _value(getattr(machine, field)) for field in fields if field != 'supplier'}
+    if 'supplier' in fields:
+        data['supplier'] = {field: getattr(machine.supplier, field) for field in SUPPLIER_FIELDS}
+    return data
+
+def _etag(*parts):
+    return hashlib.sha1(repr((API_VERSION,) + parts).encode()).hexdigest()[:20]
+
+def catalog_etag():
+    """ETag of anything computed from the whole catalog
+
+    Each max() is its own subquery so that both are read from an index
+    (SQLite only does that for a lone min/max).
+    """
+    max_id, max_updated = db.session.execute(select(
+        select(func.max(Machine.id)).scalar_subquery(),
+        select(func.max(Machine.updated_at)).scalar_subquery())).one()
+    return _etag(request.path, sorted(request.args.items(multi=True)), max_id, _value(max_updated))
+
+def machine_etag(machine_id):
+    """ETag of one machine's detail, or None if it does not exist"""
+    stamp = db.session.execute(
+        select(Machine.updated_at, User.version)
+        .join(User, User.id == Machine.supplier_id)
+        .where(Machine.id == machine_id)).first()
+    if stamp is None:
+        return None
+    return _etag(request.path, sorted(request.args.items(multi=True)), _value(stamp.updated_at), stamp.version)
+
+def conditional_json(etag, build):
+    """Answer 304 if the client has `etag`, otherwise jsonify(build())
+
+    Clients may keep the response but must revalidate it before reuse.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    return response
@@ -1,87 +1,278 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, flash, abort, g,
+                   current_app, jsonify, send_file, stream_with_context)
+from sqlalchemy import event
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from models import db, User, Machine, Enquiry
+from models import db, User, Machine, Enquiry, ImportJob, ImportRowError
+from queries import (ENQUIRY_ORDER, ENQUIRY_STATUSES, enquiry_order, supplier_enquiry_stats,
+                     SUPPLIER_MACHINE_ORDER, supplier_machines_query, count_supplier_machines,
+                     supplier_enquiries_query, load_buyer_enquiries, load_recent_enquiries,
+                     load_machine_detail, load_similar_machines, load_buyer_recommendations,
+                     machine_enquiries_query)
+from search import CATALOG_ORDER, apply_search
+from pagination import paginate, get_page_size, estimate_count
+from migrations import ensure_schema
+from instrumentation import init_instrumentation, set_instrumentation, get_settings
+from metrics import init_metrics
+from facets import FACET_FIELDS, get_facets, invalidate_facets
+from specs import SORT_OPTIONS, parse_ranges, apply_ranges, apply_sort
+from similarity import index_machine
+from rollups import load_totals, load_daily_series
+from export import EXPORT_FORMATS, parse_date, export_query, export_rows
+from machine_import import (validate_machine, allowed_import, save_upload, create_job, start_import,
+                            init_import_watchdog, IMPORT_EXTENSIONS)
+from profile_images import avatar_url, receive_upload, reuse_variants, queue_variants, release_image
+from image_proxy import PROXY_SIZES, image_cache, open_image, proxied_image, valid_signature
+from api import (API_FIELDS, LIST_FIELDS, api_error, parse_fields, load_columns, machine_json,
+                 catalog_etag, machine_etag, conditional_json)
+from page_cache import page_cache
+from assets import init_assets
+from replicas import REPLICA_PREFIX, replica_reads, replica_router
 from datetime import datetime
+from functools import wraps
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')
+SQLITE_BUSY_TIMEOUT = 30  # seconds a writer waits for a locked SQLite database
+REPLICA_CONNECT_TIMEOUT = 5  # seconds
 
-# Database configuration - Force SQLite for local development
-DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///b2b_platform.db')
-
-# Debug: Print environment variables
-print(f"Raw DATABASE_URL from env: {os.getenv('DATABASE_URL')}")
-print(f"Final DATABASE_URL: {DATABASE_URL}")
-
-# Force SQLite for local development to avoid database issues
-if not DATABASE_URL or 'hotel_db' in DATABASE_URL:
-    print("Forcing SQLite for local development...")
-    DATABASE_URL = 'sqlite:///b2b_platform.db'
-
-app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# File upload configuration
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Create upload directories if they don't exist
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'profile_images'), exist_ok=True)
+def database_url():
+    """Return the database URL from the environment, defaulting to local SQLite"""
+    url = os.getenv('DATABASE_URL') or 'sqlite:///b2b_platform.db'
+    
+    # Force SQLite for local development to avoid database issues
+    if 'hotel_db' in url:
+        url = 'sqlite:///b2b_platform.db'
+    
+    return _normalize_url(url)
+
+def _normalize_url(url):
+    # Render hands out postgres:// URLs, which SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def replica_binds():
+    """SQLALCHEMY_BINDS for the read replicas listed in DATABASE_REPLICA_URLS"""
+    urls = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    binds = {}
+    for n, url in enumerate(urls):
+        url = _normalize_url(url)
+        options = engine_options(url)
+        if not url.startswith('sqlite'):
+            # So that an unreachable replica fails its health check quickly
+            options['connect_args'] = {'connect_timeout': REPLICA_CONNECT_TIMEOUT}
+        binds[f'{REPLICA_PREFIX}{n}'] = {'url': url, **options}
+    return binds
+
+def engine_options(url):
+    """Connection pool settings for the database backend
+    
+    Each gunicorn worker gets its own pool, so workers * (pool_size +
+    max_overflow) must stay below the PostgreSQL connection limit.
+    """
+    if url.startswith('sqlite'):
+        return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT, 'check_same_thread': False}}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    """WAL lets readers run alongside a writer; NORMAL sync is safe in WAL mode"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}')
+    cursor.close()
 
-db.init_app(app)
+# Routes are collected here and registered on every app built by create_app()
+_routes = []
+
+def route(rule, **options):
+    def decorator(f):
+        _routes.append((rule, f, options))
+        return f
+    return decorator
+
+def create_app(config=None):
+    """Build the WSGI application
+    
+    Configuration comes from the environment, then `config` overrides.
+    The schema is only created when AUTO_CREATE_SCHEMA is set; in
+    production run `python init_db.py migrate` once before starting the
+    workers instead.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')
+    
+    # Database configuration
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['AUTO_CREATE_SCHEMA'] = os.getenv('AUTO_CREATE_SCHEMA', 'false').lower() == 'true'
+    
+    # Read replicas for views marked @replica_reads (see replicas.py)
+    app.config['SQLALCHEMY_BINDS'] = replica_binds()
+    app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', 10))
+    app.config['REPLICA_CHECK_SECONDS'] = float(os.getenv('REPLICA_CHECK_SECONDS', 5))
+    app.config['REPLICA_MAX_LAG_SECONDS'] = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 30))
+    
+    # Pagination configuration
+    app.config['MACHINES_PER_PAGE'] = int(os.getenv('MACHINES_PER_PAGE', 24))
+    app.config['ENQUIRIES_PER_PAGE'] = int(os.getenv('ENQUIRIES_PER_PAGE', 20))
+    app.config['SHOW_RESULT_COUNT'] = os.getenv('SHOW_RESULT_COUNT', 'true').lower() == 'true'
+    
+    # Closed enquiries older than this move to the archive (see archive.py)
+    app.config['ENQUIRY_ARCHIVE_MONTHS'] = int(os.getenv('ENQUIRY_ARCHIVE_MONTHS', 12))
+    
+    # Request instrumentation (Server-Timing header and slow-query log)
+    app.config['INSTRUMENTATION_ENABLED'] = os.getenv('INSTRUMENTATION_ENABLED', 'false').lower() == 'true'
+    app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 200))
+    app.config['SLOW_QUERY_LOG_FILE'] = os.getenv('SLOW_QUERY_LOG_FILE')
+    
+    # Page fragment cache ('memory', 'file' or 'none')
+    app.config['PAGE_CACHE_BACKEND'] = os.getenv('PAGE_CACHE_BACKEND', 'memory')
+    app.config['PAGE_CACHE_DIR'] = os.getenv('PAGE_CACHE_DIR')
+    app.config['PAGE_CACHE_TTL'] = int(os.getenv('PAGE_CACHE_TTL', 300))
+    
+    # Proxy and on-disk cache for externally hosted machine images
+    app.config['IMAGE_PROXY_ENABLED'] = os.getenv('IMAGE_PROXY_ENABLED', 'true').lower() == 'true'
+    app.config['IMAGE_CACHE_DIR'] = os.getenv('IMAGE_CACHE_DIR')
+    app.config['IMAGE_CACHE_MAX_MB'] = int(os.getenv('IMAGE_CACHE_MAX_MB', 512))
+    app.config['IMAGE_PROXY_MAX_AGE'] = int(os.getenv('IMAGE_PROXY_MAX_AGE', 30 * 24 * 3600))
+    app.config['IMAGE_PROXY_TIMEOUT'] = float(os.getenv('IMAGE_PROXY_TIMEOUT', 10))
+    app.config['IMAGE_PROXY_MAX_MB'] = int(os.getenv('IMAGE_PROXY_MAX_MB', 20))
+    app.config['IMAGE_PROXY_ALLOW_PRIVATE'] = os.getenv('IMAGE_PROXY_ALLOW_PRIVATE', 'false').lower() == 'true'
+    
+    # File upload configuration
+    app.config['UPLOAD_FOLDER'] = 'static/uploads'
+    # Large enough for a bulk import of ~100k machines
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', 64)) * 1024 * 1024
+    app.config['IMPORT_FOLDER'] = os.getenv('IMPORT_FOLDER') or os.path.join(app.instance_path, 'imports')
+    # Imports that have not progressed for this long are resumed by another worker
+    app.config['IMPORT_WATCHDOG_ENABLED'] = os.getenv('IMPORT_WATCHDOG_ENABLED', 'true').lower() == 'true'
+    app.config['IMPORT_STALE_SECONDS'] = int(os.getenv('IMPORT_STALE_SECONDS', 300))
+    app.config['PROFILE_IMAGE_MAX_MB'] = int(os.getenv('PROFILE_IMAGE_MAX_MB', 16))
+    app.config['IMAGE_WORKERS'] = int(os.getenv('IMAGE_WORKERS', 2))
+    
+    if config:
+        app.config.update(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    
+    # Create upload directories if they don't exist
+    os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'profile_images'), exist_ok=True)
+    
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _configure_sqlite)
+    replica_router.init_app(app, db)
+    
+    init_instrumentation(app)
+    init_metrics(app)
+    page_cache.init_app(app)
+    image_cache.init_app(app)
+    init_assets(app)
+    init_import_watchdog(app, on_finish=_import_finished)
+    
+    app.jinja_env.globals['avatar_url'] = avatar_url
+    app.jinja_env.globals['proxied_image'] = proxied_image
+    
+    for rule, view_func, options in _routes:
+        app.add_url_rule(rule, view_func=view_func, **options)
+    
+    if app.config['AUTO_CREATE_SCHEMA']:
+        with app.app_context():
+            ensure_schema()
+    
+    return app
 
 # Helper functions
 def is_logged_in():
     return 'user_id' in session
 
+def viewer_role():
+    """Role of the current visitor, used to key cached fragments"""
+    return session.get('user_role') or 'anonymous'
+
+def set_session_claims(user):
+    """Store the user's identity and display fields in the signed session cookie"""
+    session['user_id'] = user.id
+    session['user_name'] = user.name
+    session['user_role'] = user.role
+    session['user_profile_image'] = user.profile_image
+    session['user_version'] = user.version
+
 def get_current_user():
-    if is_logged_in():
-        return db.session.get(User, session['user_id'])
-    return None
+    """Return the logged-in User, loading it at most once per request"""
+    if 'current_user' not in g:
+        user = db.session.get(User, session['user_id']) if is_logged_in() else None
+        # Refresh stale claims if the profile changed since they were signed
+        if user is not None and session.get('user_version') != user.version:
+            set_session_claims(user)
+        g.current_user = user
+    return g.current_user
 
 def login_required(f):
+    @wraps(f)
     def decorated_function(*args, **kwargs):
         if not is_logged_in():
             flash('Please login to access this page', 'error')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
-    decorated_function.__name__ = f.__name__
     return decorated_function
 
 def role_required(*allowed_roles):
+    """Require login and one of `allowed_roles`
+
+    The role is read from the signed session claims, so the check costs no
+    database query. Sessions created before claims existed fall back to
+    loading the user.
+    """
     def decorator(f):
+        @wraps(f)
         def decorated_function(*args, **kwargs):
             if not is_logged_in():
                 flash('Please login to access this page', 'error')
                 return redirect(url_for('login'))
             
-            user = get_current_user()
-            if user.role not in allowed_roles:
+            role = session.get('user_role')
+            if role is None:
+                user = get_current_user()
+                role = user.role if user else None
+            if role not in allowed_roles:
                 flash('You do not have permission to access this page', 'error')
                 return redirect(url_for('dashboard'))
             return f(*args, **kwargs)
-        decorated_function.__name__ = f.__name__
         return decorated_function
     return decorator
 
 # Routes
-@app.route('/')
+@route('/')
+@replica_reads
 def home():
     """Home page - displays featured machines"""
-    featured_machines = Machine.query.order_by(Machine.created_at.desc()).limit(6).all()
-    return render_template('home.html', machines=featured_machines)
+    def render_content():
+        featured_machines = Machine.query.order_by(Machine.created_at.desc()).limit(6).all()
+        return render_template('home_content.html', machines=featured_machines)
+    
+    content = page_cache.fragment('home', [viewer_role()], render_content)
+    return render_template('home.html', content=content)
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     """User registration"""
     if request.method == 'POST':
@@ -117,7 +308,7 @@ def register():
     
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     """User login"""
     if request.method == 'POST':
@@ -131,10 +322,7 @@ def login():
         user = User.query.filter_by(email=email).first()
         
         if user and check_password_hash(user.password_hash, password):
-            session['user_id'] = user.id
-            session['user_name'] = user.name
-            session['user_role'] = user.role
-            session['user_profile_image'] = user.profile_image
+            set_session_claims(user)
             flash(f'Welcome back, {user.name}!', 'success')
             return redirect(url_for('dashboard'))
         else:
@@ -142,14 +330,14 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     """User logout"""
     session.clear()
     flash('You have been logged out', 'info')
     return redirect(url_for('home'))
 
-@app.route('/dashboard')
+@route('/dashboard')
 @login_required
 def dashboard():
     """Role-based dashboard"""
@@ -161,30 +349,44 @@ def dashboard():
         return redirect(url_for('login'))
     
     if user.role == 'supplier':
-        # Supplier dashboard - show their machines and enquiries
-        machines = Machine.query.filter_by(supplier_id=user.id).all()
-        machine_ids = [m.id for m in machines]
-        enquiries = Enquiry.query.filter(Enquiry.machine_id.in_(machine_ids)).order_by(Enquiry.created_at.desc()).all()
-        return render_template('dashboard_supplier.html', user=user, machines=machines, enquiries=enquiries)
+        # Supplier dashboard - show their machines and enquiries, each paginated
+        # with its own cursors (machines_after/machines_before, after/before)
+        machines = paginate(supplier_machines_query(user.id), SUPPLIER_MACHINE_ORDER,
+                            current_app.config['MACHINES_PER_PAGE'],
+                            after=request.args.get('machines_after'), before=request.args.get('machines_before'))
+        machine_count = count_supplier_machines(user.id)
+        enquiry_counts, status_counts = supplier_enquiry_stats(user.id)
+        enquiries = paginate(supplier_enquiries_query(user.id), ENQUIRY_ORDER,
+                             get_page_size(request.args.get('per_page'), current_app.config['ENQUIRIES_PER_PAGE']),
+                             after=request.args.get('after'), before=request.args.get('before'))
+        return render_template('dashboard_supplier.html', user=user, machines=machines,
+                             machine_count=machine_count, enquiries=enquiries,
+                             enquiry_counts=enquiry_counts, status_counts=status_counts)
     
     elif user.role == 'buyer':
         # Buyer dashboard - show their enquiries
-        enquiries = Enquiry.query.filter_by(buyer_id=user.id).order_by(Enquiry.created_at.desc()).all()
-        return render_template('dashboard_buyer.html', user=user, enquiries=enquiries)
+        enquiries = load_buyer_enquiries(user.id)
+        recommendations = load_buyer_recommendations(user.id)
+        return render_template('dashboard_buyer.html', user=user, enquiries=enquiries,
+                             recommendations=recommendations)
     
     elif user.role == 'admin':
-        # Admin dashboard - show overview
-        total_users = User.query.count()
-        total_machines = Machine.query.count()
-        total_enquiries = Enquiry.query.count()
-        recent_enquiries = Enquiry.query.order_by(Enquiry.created_at.desc()).limit(10).all()
+        # Admin dashboard - show overview from the rollup counters
+        totals = load_totals(['users', 'machines', 'enquiries', 'enquiries_by_category'])
+        trend_days, trends = load_daily_series(['users', 'machines', 'enquiries'])
+        top_categories = sorted(totals['enquiries_by_category'].items(), key=lambda item: -item[1])[:8]
+        recent_enquiries = load_recent_enquiries(10)
         return render_template('dashboard_admin.html', user=user, 
-                             total_users=total_users, total_machines=total_machines, 
-                             total_enquiries=total_enquiries, recent_enquiries=recent_enquiries)
+                             total_users=sum(totals['users'].values()),
+                             total_machines=sum(totals['machines'].values()), 
+                             total_enquiries=sum(totals['enquiries'].values()),
+                             enquiry_statuses=totals['enquiries'], top_categories=top_categories,
+                             trend_days=trend_days, trends=trends,
+                             recent_enquiries=recent_enquiries, instrumentation=get_settings())
     
     return redirect(url_for('home'))
 
-@app.route('/profile')
+@route('/profile')
 @login_required
 def profile():
     """User profile page"""
@@ -198,15 +400,15 @@ def profile():
     # Get additional data for profile
     if user.role == 'supplier':
         machines_count = Machine.query.filter_by(supplier_id=user.id).count()
-        machine_ids = [m.id for m in Machine.query.filter_by(supplier_id=user.id).all()]
-        enquiries_count = Enquiry.query.filter(Enquiry.machine_id.in_(machine_ids)).count()
+        _, status_counts = supplier_enquiry_stats(user.id)
+        enquiries_count = sum(status_counts.values())
     else:
         machines_count = 0
         enquiries_count = Enquiry.query.filter_by(buyer_id=user.id).count()
     
     return render_template('profile.html', user=user, machines_count=machines_count, enquiries_count=enquiries_count)
 
-@app.route('/edit-profile', methods=['GET', 'POST'])
+@route('/edit-profile', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
     """Edit user profile"""
@@ -226,75 +428,132 @@ def edit_profile():
         user.phone = request.form.get('phone', user.phone)
         
         # Handle profile image upload
-        if 'profile_image' in request.files:
-            file = request.files['profile_image']
-            if file and file.filename != '' and allowed_file(file.filename):
-                # Secure the filename
-                filename = secure_filename(file.filename)
-                # Add user ID and timestamp to make it unique
-                unique_filename = f"user_{user.id}_{int(datetime.utcnow().timestamp())}_{filename}"
-                
-                # Save the file
-                upload_path = os.path.join(app.config['UPLOAD_FOLDER'], 'profile_images', unique_filename)
-                file.save(upload_path)
-                
-                # Update user profile image path (relative to static folder)
-                user.profile_image = f'uploads/profile_images/{unique_filename}'
-                
-                # Delete old profile image if it exists
-                if user.profile_image and user.profile_image != f'uploads/profile_images/{unique_filename}':
-                    old_path = os.path.join('static', user.profile_image)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
+        upload = request.files.get('profile_image')
+        received = None
+        if upload and upload.filename != '' and allowed_file(upload.filename):
+            try:
+                received = receive_upload(upload)
+            except ValueError as e:
+                db.session.rollback()
+                flash(str(e), 'error')
+                return render_template('edit_profile.html', user=user)
         
+        # An image uploaded before is assigned now, a new one once its variants are built
+        previous_image = user.profile_image
+        image_ready = received is not None and reuse_variants(*received)
+        if image_ready:
+            user.profile_image = received[0]
+        
+        # Bump the version so other sessions reload their stale claims
+        user.version = (user.version or 0) + 1
         db.session.commit()
+        set_session_claims(user)
+        if image_ready:
+            release_image(previous_image)
+        elif received:
+            queue_variants(current_app._get_current_object(), user.id, previous_image, *received)
         flash('Profile updated successfully!', 'success')
+        if received and not image_ready:
+            flash('Your new photo will appear in a moment', 'info')
         return redirect(url_for('profile'))
     
     return render_template('edit_profile.html', user=user)
 
-@app.route('/machines')
-def machines_list():
-    """List all machines with filtering"""
-    category = request.args.get('category')
-    search = request.args.get('search')
+def catalog_query(args):
+    """Filter and order the catalog from request args
+
+    Shared by the catalog page and the API. Returns (query, sort_keys,
+    filters, ranges, search, sort), where sort is None unless a valid
+    explicit sort was applied.
+    """
+    search = args.get('search')
+    filters = {field: args.get(field) or None for field in FACET_FIELDS}
+    ranges = parse_ranges(args)
+    sort = args.get('sort')
     
     query = Machine.query
     
-    if category:
-        query = query.filter_by(category=category)
+    for field, value in filters.items():
+        if value:
+            query = query.filter(getattr(Machine, field) == value)
+    query = apply_ranges(query, ranges)
     
     if search:
-        query = query.filter(Machine.name.ilike(f'%{search}%') | 
-                           Machine.description.ilike(f'%{search}%'))
+        query, sort_keys = apply_search(query, search)
+    else:
+        sort_keys = CATALOG_ORDER
+    
+    # An explicit sort overrides search relevance
+    sorted_query = apply_sort(query, sort)
+    if sorted_query:
+        query, sort_keys = sorted_query
+    return query, sort_keys, filters, ranges, search, sort if sorted_query else None
+
+@route('/machines')
+@replica_reads
+def machines_list():
+    """List all machines with filtering"""
+    category = request.args.get('category')
+    query, sort_keys, filters, ranges, search, sort = catalog_query(request.args)
     
-    machines = query.order_by(Machine.created_at.desc()).all()
-    categories = db.session.query(Machine.category).distinct().all()
-    categories = [cat[0] for cat in categories if cat[0]]
+    per_page = get_page_size(request.args.get('per_page'), current_app.config['MACHINES_PER_PAGE'])
+    machines = paginate(query, sort_keys, per_page,
+                        after=request.args.get('after'), before=request.args.get('before'))
+    total_estimate = estimate_count(query) if current_app.config['SHOW_RESULT_COUNT'] else None
+    facets = get_facets(filters, search, ranges)
     
-    return render_template('machines_list.html', machines=machines, categories=categories, 
-                         selected_category=category, search_query=search)
+    return render_template('machines_list.html', machines=machines, facets=facets,
+                         filters=filters, selected_category=category, search_query=search,
+                         total_estimate=total_estimate, sort=sort,
+                         sort_options=SORT_OPTIONS)
 
-@app.route('/machine/<int:machine_id>')
+@route('/machine/<int:machine_id>')
+@replica_reads
 def machine_detail(machine_id):
     """Machine detail page with fully dynamic content"""
-    machine = Machine.query.get_or_404(machine_id)
-    supplier = User.query.get(machine.supplier_id)
+    # The supplier's version changes with their profile, which the fragment shows
+    stamp = db.session.query(Machine.name, Machine.supplier_id, Machine.updated_at, User.version) \
+        .join(User, User.id == Machine.supplier_id).filter(Machine.id == machine_id).first()
+    if stamp is None:
+        abort(404)
+    
+    def render_content():
+        detail = load_machine_detail(machine_id)
+        return render_template('machine_detail_content.html', 
+                             machine=detail.machine, 
+                             supplier=detail.supplier,
+                             supplier_machines_count=detail.supplier_machines_count,
+                             enquiry_stats=detail.enquiry_stats,
+                             similar_machines=load_similar_machines(machine_id))
     
-    # Get additional supplier stats
-    supplier_machines_count = Machine.query.filter_by(supplier_id=supplier.id).count()
+    content = page_cache.fragment('machine_detail', [machine_id, stamp.updated_at, stamp.version, viewer_role()],
+                                  render_content)
     
-    # Get all enquiries for this machine (for buyer context)
-    machine_enquiries = Enquiry.query.filter_by(machine_id=machine.id).all()
+    # The owning supplier also sees the enquiries themselves, one page at a time
+    enquiries = None
+    if session.get('user_id') == stamp.supplier_id:
+        enquiries = paginate(machine_enquiries_query(machine_id), ENQUIRY_ORDER,
+                             get_page_size(request.args.get('per_page'), current_app.config['ENQUIRIES_PER_PAGE']),
+                             after=request.args.get('after'), before=request.args.get('before'))
     
-    return render_template('machine_detail.html', 
-                         machine=machine, 
-                         supplier=supplier,
-                         supplier_machines_count=supplier_machines_count,
-                         machine_enquiries=machine_enquiries)
+    return render_template('machine_detail.html', machine_id=machine_id, machine_name=stamp.name,
+                         content=content, enquiries=enquiries)
 
-@app.route('/add-machine', methods=['GET', 'POST'])
-@login_required
+@route('/image-proxy/<size>')
+def image_proxy(size):
+    """Resized, cached copy of an external machine image (URLs come from proxied_image())"""
+    url = request.args.get('url', '')
+    if size not in PROXY_SIZES or not valid_signature(url, request.args.get('sig')):
+        abort(404)
+    cached = open_image(url, size)
+    if cached is None:
+        # Let the browser try the original host
+        return redirect(url)
+    f, etag = cached
+    return send_file(f, mimetype='image/webp', etag=etag, conditional=True,
+                     max_age=current_app.config['IMAGE_PROXY_MAX_AGE'])
+
+@route('/add-machine', methods=['GET', 'POST'])
 @role_required('supplier')
 def add_machine():
     """Add new machine (supplier only)"""
@@ -326,14 +585,10 @@ def add_machine():
         image_working = request.form.get('image_working')
         image_closeup = request.form.get('image_closeup')
         
-        # Validation
-        if not all([name, category, use_case, price_range, description]):
-            flash('All basic fields are required', 'error')
-            return render_template('add_machine.html')
-        
-        # At least one image is required
-        if not any([image_front, image_side, image_working, image_closeup]):
-            flash('At least one machine image is required', 'error')
+        # Validation (shared with bulk imports)
+        error = validate_machine(request.form)
+        if error:
+            flash(error, 'error')
             return render_template('add_machine.html')
         
         # Create machine object
@@ -362,7 +617,11 @@ def add_machine():
         
         try:
             db.session.add(machine)
+            db.session.flush()
+            index_machine(machine)
             db.session.commit()
+            invalidate_facets()
+            page_cache.invalidate()
             flash('Machine added successfully!', 'success')
             return redirect(url_for('machine_detail', machine_id=machine.id))
         except Exception as e:
@@ -372,8 +631,62 @@ def add_machine():
     
     return render_template('add_machine.html')
 
-@app.route('/enquiry/<int:machine_id>', methods=['GET', 'POST'])
-@login_required
+def _import_finished():
+    invalidate_facets()
+    page_cache.invalidate()
+
+@route('/import-machines', methods=['GET', 'POST'])
+@role_required('supplier')
+def import_machines():
+    """Bulk import machines from a CSV or XLSX file (supplier only)"""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a file to import', 'error')
+        elif not allowed_import(upload.filename):
+            flash('Only CSV and XLSX files can be imported', 'error')
+        else:
+            path = save_upload(upload, current_app.config['IMPORT_FOLDER'])
+            job = create_job(session['user_id'], secure_filename(upload.filename), path)
+            start_import(current_app._get_current_object(), job.id, on_finish=_import_finished)
+            return redirect(url_for('import_status', job_id=job.id))
+    
+    jobs = ImportJob.query.filter_by(supplier_id=session['user_id']) \
+        .order_by(ImportJob.created_at.desc()).limit(10).all()
+    return render_template('import_machines.html', jobs=jobs, extensions=sorted(IMPORT_EXTENSIONS))
+
+def _supplier_job(job_id):
+    job = db.session.get(ImportJob, job_id)
+    if job is None or job.supplier_id != session['user_id']:
+        abort(404)
+    return job
+
+def _job_progress(job):
+    return {
+        'status': job.status,
+        'total_rows': job.total_rows,
+        'rows_done': job.rows_done,
+        'imported': job.imported,
+        'failed': job.failed,
+        'message': job.message,
+    }
+
+@route('/import-machines/<int:job_id>')
+@role_required('supplier')
+def import_status(job_id):
+    """Progress and rejected rows of an import"""
+    job = _supplier_job(job_id)
+    errors = ImportRowError.query.filter_by(job_id=job.id) \
+        .order_by(ImportRowError.row_number).limit(100).all()
+    return render_template('import_status.html', job=job, errors=errors, progress=_job_progress(job))
+
+@route('/import-machines/<int:job_id>/progress')
+@role_required('supplier')
+def import_progress(job_id):
+    """Import progress as JSON, polled by the status page"""
+    return jsonify(_job_progress(_supplier_job(job_id)))
+
+@route('/enquiry/<int:machine_id>', methods=['GET', 'POST'])
 @role_required('buyer')
 def create_enquiry(machine_id):
     """Create enquiry for a machine (buyer only)"""
@@ -402,6 +715,7 @@ def create_enquiry(machine_id):
         try:
             db.session.add(enquiry)
             db.session.commit()
+            page_cache.invalidate()
             flash('Enquiry sent successfully!', 'success')
             return redirect(url_for('dashboard'))
         except Exception as e:
@@ -410,27 +724,119 @@ def create_enquiry(machine_id):
     
     return render_template('enquiry_form.html', machine=machine)
 
-@app.route('/enquiries')
-@login_required
+@route('/enquiries')
 @role_required('supplier')
 def view_enquiries():
     """View enquiries for supplier's machines"""
-    user = get_current_user()
-    machines = Machine.query.filter_by(supplier_id=user.id).all()
-    machine_ids = [m.id for m in machines]
-    enquiries = Enquiry.query.filter(Enquiry.machine_id.in_(machine_ids)).order_by(Enquiry.created_at.desc()).all()
+    supplier_id = session['user_id']
+    # ?history=1 includes archived enquiries (see archive.py)
+    history = request.args.get('history') == '1'
+    _, status_counts = supplier_enquiry_stats(supplier_id, history)
+    enquiries = paginate(supplier_enquiries_query(supplier_id, history), enquiry_order(history),
+                         get_page_size(request.args.get('per_page'), current_app.config['ENQUIRIES_PER_PAGE']),
+                         after=request.args.get('after'), before=request.args.get('before'))
     
-    return render_template('enquiries_list.html', enquiries=enquiries, machines=machines)
+    return render_template('enquiries_list.html', enquiries=enquiries, status_counts=status_counts,
+                           history=history)
 
-# Create database tables
-try:
-    with app.app_context():
-        db.create_all()
-        print("Database tables created successfully!")
-except Exception as e:
-    print(f"Database initialization error: {e}")
-    print("Application will start, but database operations may fail.")
+@route('/enquiries/export')
+@role_required('supplier', 'admin')
+def export_enquiries():
+    """Stream enquiries as CSV or JSONL (suppliers get their own machines' enquiries)
+    
+    Query parameters: format (csv or jsonl), status, start and end
+    (YYYY-MM-DD, inclusive), gzip=1 and history=1 to include archived
+    enquiries.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+    status = request.args.get('status') or None
+    if status is not None and status not in ENQUIRY_STATUSES:
+        abort(400)
+    start, end = (parse_date(request.args.get(param)) if request.args.get(param) else None
+                  for param in ('start', 'end'))
+    if (request.args.get('start') and start is None) or (request.args.get('end') and end is None):
+        abort(400)
+    
+    supplier_id = session['user_id'] if session.get('user_role') == 'supplier' else None
+    statement = export_query(supplier_id=supplier_id, status=status, start=start, end=end,
+                             history=request.args.get('history') == '1')
+    compress = request.args.get('gzip') == '1'
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"enquiries-{datetime.utcnow():%Y%m%d}.{extension}" + ('.gz' if compress else '')
+    response = Response(stream_with_context(export_rows(statement, export_format, compress)),
+                        mimetype='application/gzip' if compress else mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Stop proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@route('/admin/instrumentation', methods=['POST'])
+@role_required('admin')
+def update_instrumentation():
+    """Switch request instrumentation on or off without a restart (admin only)"""
+    enabled = request.form.get('enabled') == 'on'
+    slow_query_ms = request.form.get('slow_query_ms')
+    
+    try:
+        slow_query_ms = float(slow_query_ms) if slow_query_ms else None
+    except ValueError:
+        flash('Slow query threshold must be a number', 'error')
+        return redirect(url_for('dashboard'))
+    
+    set_instrumentation(enabled=enabled, slow_query_ms=slow_query_ms)
+    flash(f"Request instrumentation {'enabled' if enabled else 'disabled'}", 'success')
+    return redirect(url_for('dashboard'))
+
+# JSON API (see api.py)
+@route('/api/v1/machines')
+@replica_reads
+def api_machines():
+    """Catalog page as JSON, with the filters, search and sorts of /machines"""
+    fields = parse_fields(request.args.get('fields'), LIST_FIELDS, API_FIELDS)
+    if fields is None:
+        return api_error(400, f"fields must be among: {', '.join(API_FIELDS)}")
+    
+    def build():
+        query, sort_keys, _, _, _, _ = catalog_query(request.args)
+        per_page = get_page_size(request.args.get('per_page'), current_app.config['MACHINES_PER_PAGE'])
+        page = paginate(query.options(*load_columns(fields)), sort_keys, per_page,
+                        after=request.args.get('after'), before=request.args.get('before'))
+        return {'data': [machine_json(machine, fields) for machine in page],
+                'next': page.next_cursor, 'prev': page.prev_cursor}
+    
+    return conditional_json(catalog_etag(), build)
+
+@route('/api/v1/machines/<int:machine_id>')
+@replica_reads
+def api_machine(machine_id):
+    """One machine with its supplier as JSON"""
+    fields = parse_fields(request.args.get('fields'), API_FIELDS + ['supplier'], API_FIELDS + ['supplier'])
+    if fields is None:
+        return api_error(400, f"fields must be among: {', '.join(API_FIELDS + ['supplier'])}")
+    etag = machine_etag(machine_id)
+    if etag is None:
+        return api_error(404, 'Machine not found')
+    
+    def build():
+        machine = Machine.query.options(*load_columns(fields)).filter_by(id=machine_id).one()
+        return {'data': machine_json(machine, fields)}
+    
+    return conditional_json(etag, build)
+
+@route('/api/v1/categories')
+@replica_reads
+def api_categories():
+    """Machine counts per category, narrowed by the same filters as /machines"""
+    def build():
+        _, _, filters, ranges, search, _ = catalog_query(request.args)
+        return {'data': [{'name': name, 'machines': count}
+                         for name, count in get_facets(filters, search, ranges)['category']]}
+    
+    return conditional_json(catalog_etag(), build)
 
 if __name__ == '__main__':
-    print(f"Using database: {app.config['SQLALCHEMY_DATABASE_URI']}")
-    app.run(debug=True)
+    # Local development server; production runs gunicorn (see gunicorn.conf.py)
+    app = create_app({'AUTO_CREATE_SCHEMA': True})
+    app.run(debug=os.getenv('FLASK_DEBUG', '1') == '1')
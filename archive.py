@@ -0,0 +1,83 @@
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import DateTime, delete, func, insert, literal, select, union_all
+from sqlalchemy.orm import aliased
+from models import db, Enquiry, ArchivedEnquiry
+
+# Hot/cold storage for enquiries.
+# Closed enquiries older than ENQUIRY_ARCHIVE_MONTHS are moved from
+# `enquiries` to `enquiries_archive` by archive_enquiries() (python init_db.py
+# archive, run nightly), so the hot table and its created_at indexes only
+# hold what the dashboards actually show. Rows move oldest first in batches
+# of ARCHIVE_BATCH, each batch copied and deleted in one short transaction:
+# a run never holds locks for long, and an interrupted run just leaves the
+# rest for the next one. Rows keep their id.
+#
+# Reads see the hot table only. A caller that asks for history queries
+# EnquiryHistory instead, an alias of Enquiry over both tables that works
+# wherever Enquiry does for reading (filters, joins, eager loads, keyset
+# pagination). Archived rows are read-only.
+#
+# The admin dashboard counters are all-time totals and keep counting
+# archived enquiries: the move bypasses the rollup listeners, and
+# rebuild_rollups() counts from EnquiryHistory.
+
+ARCHIVE_BATCH = 1000
+ARCHIVE_STATUSES = ['closed']
+
+_COLUMNS = [column.name for column in Enquiry.__table__.columns]
+
+EnquiryHistory = aliased(Enquiry, union_all(
+    select(*[Enquiry.__table__.c[name] for name in _COLUMNS]),
+    select(*[ArchivedEnquiry.__table__.c[name] for name in _COLUMNS]),
+).subquery('enquiry_history'), name='enquiry_history')
+
+def enquiry_source(history=False):
+    """Entity to query enquiries from: Enquiry, or EnquiryHistory to include the archive"""
+    return EnquiryHistory if history else Enquiry
+
+def archive_cutoff(months):
+    """Enquiries created before this are old enough to archive (months of 30 days)"""
+    return datetime.utcnow() - timedelta(days=30 * months)
+
+def archive_enquiries(months=None, batch_size=ARCHIVE_BATCH, pause=0, progress=None):
+    """Move old closed enquiries to the archive, one batch per transaction
+
+    `pause` seconds are slept between batches to leave room for other
+    writers; `progress` is called with the running total after each batch.
+    Returns the number of enquiries moved.
+    """
+    if months is None:
+        months = current_app.config['ENQUIRY_ARCHIVE_MONTHS']
+    hot = Enquiry.__table__
+    cold = ArchivedEnquiry.__table__
+    cutoff = archive_cutoff(months)
+    # The newest row always stays: SQLite hands out max(id) + 1 as the next
+    # id, which would collide with an archived one
+    newest = select(func.max(hot.c.id)).scalar_subquery()
+    moved = 0
+    while True:
+        with db.engine.begin() as conn:
+            ids = conn.execute(
+                select(hot.c.id)
+                .where(hot.c.status.in_(ARCHIVE_STATUSES), hot.c.created_at < cutoff, hot.c.id < newest)
+                .order_by(hot.c.created_at, hot.c.id)
+                .limit(batch_size)
+                # Rows being updated are left for the next run (PostgreSQL)
+                .with_for_update(skip_locked=True)).scalars().all()
+            if not ids:
+                break
+            conn.execute(insert(cold).from_select(
+                _COLUMNS + ['archived_at'],
+                select(*[hot.c[name] for name in _COLUMNS], literal(datetime.utcnow(), DateTime))
+                .where(hot.c.id.in_(ids))))
+            conn.execute(delete(hot).where(hot.c.id.in_(ids)))
+        moved += len(ids)
+        if progress:
+            progress(moved)
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return moved
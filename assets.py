@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Build fingerprinted, precompressed static assets
+
+    python assets.py            # writes static/dist/ and its manifest
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # gzip copies only
+    brotli = None
+
+# Fingerprinted static assets.
+# `python assets.py` copies every file under ASSET_DIRS to static/dist/ with
+# a content hash in its name (css/style.css -> dist/css/style.1a2b3c4d5e.css),
+# minifying CSS and JS and writing .gz and .br copies next to each text file,
+# and records the mapping in static/dist/manifest.json. init_assets() loads
+# the manifest and makes url_for('static', filename='css/style.css') return
+# the hashed name. Since a changed file gets a new name, dist/ is served
+# with a one-year immutable Cache-Control, picking the .br or .gz copy that
+# the request's Accept-Encoding allows.
+#
+# Without a manifest (no build yet) the plain files are served as before.
+# An entry whose source file changed after the build is ignored as well,
+# so edits show up in development without rebuilding.
+
+ASSET_DIRS = ['css', 'js', 'images']
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt'}
+HASH_LENGTH = 10
+MAX_AGE = 365 * 24 * 3600
+
+# Encodings in order of preference, with the suffix of their copy
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+_CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/|\s+', re.S)
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*|(:)\s+')
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+def _squeeze_css(code):
+    return _CSS_PUNCTUATION.sub(lambda match: match.group(1) or match.group(2), code).replace(';}', '}')
+
+def minify_css(text):
+    """Drop comments and needless whitespace, leaving strings untouched"""
+    parts = []
+    code = []
+    position = 0
+    for match in _CSS_TOKENS.finditer(text):
+        code.append(text[position:match.start()])
+        position = match.end()
+        if match.group(1):
+            parts.append(_squeeze_css(''.join(code)))
+            parts.append(match.group(1))
+            code = []
+        else:
+            code.append(' ')
+    code.append(text[position:])
+    parts.append(_squeeze_css(''.join(code)))
+    return ''.join(parts).strip()
+
+def _js_line_state(line, in_template):
+    """Return (in_template, comment) at the end of a line of JavaScript
+
+    `comment` is where a block comment left open by the line starts, or
+    None. Quotes, template literals and comments are tracked well enough for
+    minify_js(); ${} expressions and regex literals are not parsed.
+    """
+    quote = None
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if in_template or quote:
+            if c == '\\':
+                i += 2
+                continue
+            if in_template and c == '`':
+                in_template = False
+            elif c == quote:
+                quote = None
+        elif c in '\'"':
+            quote = c
+        elif c == '`':
+            in_template = True
+        elif line.startswith('//', i):
+            break
+        elif line.startswith('/*', i):
+            end = line.find('*/', i + 2)
+            if end < 0:
+                return in_template, i
+            i = end + 2
+            continue
+        i += 1
+    return in_template, None
+
+def minify_js(text):
+    """Strip indentation, blank lines and whole-line comments
+
+    Line breaks are kept so that automatic semicolon insertion still sees
+    them; comments after code are left alone because // may be in a string.
+    Lines inside template literals are kept as they are.
+    """
+    lines = []
+    in_comment = in_template = False
+    for line in text.splitlines():
+        if in_template:
+            in_template, comment = _js_line_state(line, True)
+            in_comment = comment is not None
+            lines.append(line if comment is None else line[:comment].rstrip())
+            continue
+        if in_comment:
+            end = line.find('*/')
+            if end < 0:
+                continue
+            line = line[end + 2:]
+            in_comment = False
+        line = line.lstrip()
+        # Drop leading comments; code after a closing */ stays
+        while line.startswith('/*'):
+            end = line.find('*/', 2)
+            if end < 0:
+                in_comment = True
+                line = ''
+                break
+            line = line[end + 2:].lstrip()
+        if not line.rstrip() or line.startswith('//'):
+            continue
+        in_template, comment = _js_line_state(line, False)
+        if comment is not None:
+            in_comment = True
+            line = line[:comment]
+        # Trailing whitespace of a line that opens a template literal is part of it
+        lines.append(line if in_template else line.rstrip())
+    return '\n'.join(lines) + '\n'
+
+def _hashed_name(path, data):
+    root, extension = posixpath.splitext(path)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{extension}'
+
+def _source_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _rewrite_css_urls(text, path, manifest):
+    """Point url() references at the hashed names of files already built"""
+    def replace(match):
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(path), match.group(2)))
+        if target not in manifest:
+            return match.group(0)
+        hashed = manifest[target]['file'][len(DIST_DIR) + 1:]
+        return f'url({posixpath.relpath(hashed, posixpath.dirname(path))})'
+    return _CSS_URL.sub(replace, text)
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def build_assets(static_folder):
+    """Rebuild static/dist/ from ASSET_DIRS and return the manifest"""
+    dist = os.path.join(static_folder, DIST_DIR)
+    sources = []
+    for directory in ASSET_DIRS:
+        for parent, _, names in os.walk(os.path.join(static_folder, directory)):
+            for name in names:
+                source = os.path.join(parent, name)
+                sources.append(os.path.relpath(source, static_folder).replace(os.sep, '/'))
+    # Stylesheets last, so their url()s can refer to the hashed images
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+
+    manifest = {}
+    written = {os.path.join(dist, MANIFEST)}
+    for path in sources:
+        source = os.path.join(static_folder, path)
+        with open(source, 'rb') as f:
+            data = f.read()
+        extension = posixpath.splitext(path)[1]
+        if extension == '.css':
+            data = minify_css(_rewrite_css_urls(data.decode('utf-8'), path, manifest)).encode('utf-8')
+        elif extension == '.js':
+            data = minify_js(data.decode('utf-8')).encode('utf-8')
+        hashed = posixpath.join(DIST_DIR, _hashed_name(path, data))
+        target = os.path.join(static_folder, hashed)
+        _write(target, data)
+        written.add(target)
+        if extension in COMPRESSIBLE:
+            copies = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                copies.append(('.br', brotli.compress(data, quality=11)))
+            for suffix, compressed in copies:
+                if len(compressed) < len(data):
+                    _write(target + suffix, compressed)
+                    written.add(target + suffix)
+        manifest[path] = {'file': hashed, 'source': _source_hash(source)}
+
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    # Drop the output of earlier builds
+    for parent, _, names in os.walk(dist):
+        for name in names:
+            if os.path.join(parent, name) not in written:
+                os.remove(os.path.join(parent, name))
+    return manifest
+
+def load_manifest(static_folder):
+    """Return {source path: hashed path} for the built files that are up to date"""
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    current = {}
+    for path, entry in manifest.items():
+        source = os.path.join(static_folder, path)
+        if os.path.exists(source) and _source_hash(source) == entry['source'] \
+                and os.path.exists(os.path.join(static_folder, entry['file'])):
+            current[path] = entry['file']
+    return current
+
+def _serve_dist(filename):
+    """Serve a built asset, precompressed if the client accepts it"""
+    directory = os.path.join(current_app.static_folder, DIST_DIR)
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.exists(os.path.join(directory, filename + suffix)):
+            response = send_from_directory(directory, filename + suffix, max_age=MAX_AGE,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, max_age=MAX_AGE)
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+def init_assets(app):
+    """Serve static/dist/ and rewrite url_for('static', ...) to the built names"""
+    manifest = load_manifest(app.static_folder)
+    app.add_url_rule(f'{app.static_url_path}/{DIST_DIR}/<path:filename>', 'static_dist', _serve_dist)
+
+    @app.url_defaults
+    def hashed_static(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+if __name__ == '__main__':
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    for path, entry in sorted(build_assets(static_folder).items()):
+        sizes = [os.path.getsize(os.path.join(static_folder, entry['file']) + suffix)
+                 for suffix in ('', '.gz', '.br')
+                 if os.path.exists(os.path.join(static_folder, entry['file']) + suffix)]
+        print(f"{path:24} -> {entry['file']:40} {' / '.join(f'{size:,}' for size in sizes)} bytes")
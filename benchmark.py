@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Route benchmark for the B2B Manufacturing Platform
+Seeds synthetic datasets, drives the main routes through Flask's test client
+and checks each route against its SQL statement budget.
+
+    python benchmark.py                        # small and medium datasets
+    python benchmark.py --scale large          # 1M machines (seeded once, then reused)
+    python benchmark.py --compare old.json     # show changes against an earlier run
+    python benchmark.py --scale large --similarity   # also time the similarity index build
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from flask import session
+from sqlalchemy import event, func, select
+from werkzeug.security import generate_password_hash
+from app import create_app, set_session_claims
+from models import db, User, Machine, Enquiry
+from datagen import generate
+from facets import invalidate_facets
+
+# Dataset sizes; enquiries grow with the catalog
+SCALES = {
+    'small': {'suppliers': 50, 'buyers': 200, 'machines': 1_000, 'enquiries': 5_000},
+    'medium': {'suppliers': 2_000, 'buyers': 10_000, 'machines': 100_000, 'enquiries': 500_000},
+    'large': {'suppliers': 50_000, 'buyers': 200_000, 'machines': 1_000_000, 'enquiries': 5_000_000},
+}
+
+# (name, viewer role, url, max SQL statements per request)
+# A viewer of None is anonymous. Budgets hold on a cold cache too, so a
+# route that starts issuing a query per row fails here long before it is
+# slow enough to notice. Tighten them when a route gets cheaper.
+ROUTES = [
+    ('home', None, '/', 1),
+    ('machines', None, '/machines', 5),
+    ('machines_search', None, '/machines?search=cnc+steel', 5),
+    ('machines_category', None, '/machines?category=CNC+Machines', 5),
+    ('machines_price_sort', None, '/machines?max_price=10+lakh&sort=price_asc', 5),
+    ('machine_detail', None, '/machine/{machine_id}', 3),
+    ('machine_detail_owner', 'supplier', '/machine/{machine_id}', 4),
+    ('dashboard_supplier', 'supplier', '/dashboard', 5),
+    ('dashboard_buyer', 'buyer', '/dashboard', 3),
+    ('dashboard_admin', 'admin', '/dashboard', 4),
+    ('enquiries', 'supplier', '/enquiries', 2),
+    ('enquiries_history', 'supplier', '/enquiries?history=1', 2),
+    ('api_machines', None, '/api/v1/machines', 2),
+    ('api_machines_search', None, '/api/v1/machines?search=cnc+steel&fields=name,price_range', 2),
+    ('api_machine', None, '/api/v1/machines/{machine_id}', 2),
+]
+
+BENCHMARK_ADMIN_EMAIL = 'benchmark-admin@example.com'
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def seed(scale):
+    """Generate the dataset for `scale` unless the database already has machines"""
+    if db.session.execute(select(func.count(Machine.id))).scalar():
+        return
+    print(f"Seeding {scale} dataset (one-off)...")
+    generate(**SCALES[scale])
+
+def pick_viewers():
+    """Choose a user id for each role and the machine to open"""
+    admin = User.query.filter_by(email=BENCHMARK_ADMIN_EMAIL).first()
+    if admin is None:
+        admin = User(name='Benchmark Admin', email=BENCHMARK_ADMIN_EMAIL,
+                     password_hash=generate_password_hash('password123'), role='admin')
+        db.session.add(admin)
+        db.session.commit()
+    # The supplier whose machine drew the most enquiries has the heaviest inbox
+    machine_id = db.session.execute(
+        select(Enquiry.machine_id).group_by(Enquiry.machine_id)
+        .order_by(func.count(Enquiry.id).desc()).limit(1)).scalar()
+    machine = db.session.get(Machine, machine_id)
+    buyer_id = db.session.execute(
+        select(Enquiry.buyer_id).group_by(Enquiry.buyer_id)
+        .order_by(func.count(Enquiry.id).desc()).limit(1)).scalar()
+    viewers = {'supplier': machine.supplier_id, 'buyer': buyer_id, 'admin': admin.id}
+    return viewers, machine.id
+
+class StatementCounter:
+    """Count SQL statements executed on an engine"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+def login(app, client, user_id):
+    """Sign the test client in as `user_id` (anonymous when None)"""
+    with app.test_request_context():
+        if user_id is not None:
+            set_session_claims(db.session.get(User, user_id))
+        claims = dict(session)
+        db.session.remove()
+    with client.session_transaction() as sess:
+        sess.clear()
+        sess.update(claims)
+
+def bench_route(client, counter, url, requests):
+    """Time `requests` GETs of `url`; the first one is a warm-up and is not timed"""
+    latencies = []
+    statements = []
+    for i in range(requests + 1):
+        counter.count = 0
+        started = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        statements.append(counter.count)
+        if i:
+            latencies.append(elapsed * 1000)
+    return {
+        'requests': requests,
+        'throughput_rps': round(requests / (sum(latencies) / 1000), 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(statistics.mean(latencies), 2),
+        'statements': max(statements),
+    }
+
+def bench_similarity_build(database_url):
+    """Run `init_db.py similarity` in a child process and measure its time and peak memory"""
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'init_db.py', 'similarity'],
+                               env=dict(os.environ, DATABASE_URL=database_url))
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise RuntimeError(f"similarity build failed with exit code {process.returncode}")
+    result = {
+        'build_seconds': round(time.perf_counter() - started, 2),
+        'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),  # ru_maxrss is in KiB on Linux
+    }
+    print(f"  similarity build: {result['build_seconds']}s, peak RSS {result['peak_rss_mb']} MB")
+    return result
+
+def benchmark_app(database_url, page_cache='none'):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'AUTO_CREATE_SCHEMA': True,
+        'PAGE_CACHE_BACKEND': page_cache,
+        'INSTRUMENTATION_ENABLED': False,
+        'IMPORT_WATCHDOG_ENABLED': False,
+    })
+
+def prepare(scale, database_url):
+    """Create and seed the database for `scale` if needed"""
+    with benchmark_app(database_url).app_context():
+        seed(scale)
+
+def run_scale(scale, database_url, requests, page_cache):
+    app = benchmark_app(database_url, page_cache)
+    # Facet counts are cached per process and would leak between datasets
+    invalidate_facets()
+    with app.app_context():
+        seed(scale)
+        viewers, machine_id = pick_viewers()
+        machines = db.session.execute(select(func.count(Machine.id))).scalar()
+        counter = StatementCounter(db.engine)
+
+    # Requests run outside the app context above so each one gets a fresh
+    # session, as it would in production
+    client = app.test_client()
+    results = {}
+    print(f"\n[{scale}] {machines:,} machines")
+    for name, role, url, budget in ROUTES:
+        login(app, client, viewers.get(role))
+        result = bench_route(client, counter, url.format(machine_id=machine_id), requests)
+        result['budget'] = budget
+        result['within_budget'] = result['statements'] <= budget
+        results[name] = result
+        flag = '' if result['within_budget'] else f'  OVER BUDGET ({budget})'
+        print(f"  {name:22} {result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']:7.2f} ms  "
+              f"p99 {result['p99_ms']:7.2f} ms  {result['statements']} queries{flag}")
+    return results
+
+def compare(previous, current):
+    """Print the p50 and statement-count change of every route against an earlier run"""
+    print(f"\nCompared with {previous.get('commit') or 'previous run'}:")
+    for scale, routes in current['scales'].items():
+        old_routes = previous.get('scales', {}).get(scale, {})
+        for name, result in routes.items():
+            old = old_routes.get(name)
+            if not old:
+                continue
+            change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0
+            queries = result['statements'] - old['statements']
+            print(f"  [{scale}] {name:22} p50 {change:+6.1f}%  queries {queries:+d}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the main routes')
+    parser.add_argument('--scale', action='append', choices=SCALES,
+                        help='dataset size, may be repeated (default: small and medium)')
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--data-dir', default=os.path.join('instance', 'benchmark'),
+                        help='where the seeded SQLite databases are kept')
+    parser.add_argument('--database-url', help='benchmark this database instead (seeded if empty)')
+    parser.add_argument('--page-cache', default='none', choices=['none', 'memory'],
+                        help='page cache backend; off by default so the database work is measured')
+    parser.add_argument('--output', help='JSON results file (default: benchmark-<commit>.json)')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    parser.add_argument('--similarity', action='store_true',
+                        help='rebuild the similar-machines index first and record its time and memory')
+    options = parser.parse_args(argv)
+
+    scales = options.scale or ['small', 'medium']
+    if options.database_url and len(scales) > 1:
+        parser.error('--database-url takes a single --scale')
+    os.makedirs(options.data_dir, exist_ok=True)
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': platform.python_version(),
+        'requests_per_route': options.requests,
+        'page_cache': options.page_cache,
+        'scales': {},
+    }
+    for scale in scales:
+        database_url = options.database_url or \
+            f"sqlite:///{os.path.abspath(os.path.join(options.data_dir, scale + '.db'))}"
+        report['database'] = database_url.split(':', 1)[0]
+        if options.similarity:
+            prepare(scale, database_url)
+            report.setdefault('similarity', {})[scale] = bench_similarity_build(database_url)
+        report['scales'][scale] = run_scale(scale, database_url, options.requests, options.page_cache)
+
+    output = options.output or f"benchmark-{commit or 'local'}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if options.compare:
+        with open(options.compare) as f:
+            compare(json.load(f), report)
+
+    over = [f'{scale}/{name}' for scale, routes in report['scales'].items()
+            for name, result in routes.items() if not result['within_budget']]
+    if over:
+        print(f"Query budget exceeded: {', '.join(over)}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
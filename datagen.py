@@ -0,0 +1,242 @@
+import bisect
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select, text
+from werkzeug.security import generate_password_hash
+from models import db, User, Machine, Enquiry
+from search import drop_search, init_search
+from specs import KW_PER_HP, parse_power_kw
+from rollups import rebuild_rollups
+
+# Synthetic data generator for scale testing (python init_db.py generate).
+# Rows are written with SQLAlchemy Core executemany inserts in batches, one
+# transaction per batch, with explicit primary keys so nothing has to be read
+# back. Distributions are skewed like real traffic: a few categories and
+# suppliers dominate the catalog and a few machines get most enquiries.
+# Must be called inside an app context.
+
+# Cap on a machine's enquiry weight, relative to the least popular machine.
+# Uncapped, a single extreme Pareto draw can take most of all enquiries.
+MAX_ENQUIRY_WEIGHT = 5000
+
+# Every generated account shares this password; it is hashed once up front
+# because generate_password_hash is deliberately slow.
+GENERATED_PASSWORD = 'password123'
+
+# (category, relative weight, typical price in rupees, use case)
+CATEGORIES = [
+    ('CNC Machines', 18, 2_000_000, 'Precision Metal Cutting and Drilling'),
+    ('Lathe Machines', 14, 900_000, 'Metal Turning and Shaping'),
+    ('Press Machines', 11, 800_000, 'Metal Forming and Stamping'),
+    ('Welding Machines', 12, 250_000, 'Metal Fabrication and Joining'),
+    ('Cutting Machines', 9, 2_500_000, 'Precision Metal Cutting'),
+    ('Packaging Machines', 10, 600_000, 'Filling, Sealing and Packing'),
+    ('Injection Moulding', 7, 3_500_000, 'Plastic Component Moulding'),
+    ('Textile Machines', 6, 1_200_000, 'Weaving and Knitting'),
+    ('Food Processing', 5, 700_000, 'Food Grinding and Mixing'),
+    ('Printing Machines', 4, 1_500_000, 'Offset and Flexo Printing'),
+    ('Grinding Machines', 3, 500_000, 'Surface and Cylindrical Grinding'),
+    ('Woodworking Machines', 1, 300_000, 'Wood Cutting and Planing'),
+]
+
+BRANDS = ['Ace', 'Bharat', 'DMG', 'Harrison', 'Jyoti', 'Kirloskar', 'Lakshmi', 'Mazak',
+          'Om', 'Prakash', 'Shree', 'Tata', 'Usha', 'Vijay', 'Yash']
+ADJECTIVES = ['Heavy Duty', 'High Speed', 'Compact', 'Automatic', 'Precision', 'Industrial',
+              'Hydraulic', 'Pneumatic', 'Digital', 'Servo']
+MATERIALS = ['Mild Steel', 'Stainless Steel', 'Aluminum', 'Brass', 'Copper', 'Cast Iron',
+             'Plastic Granules', 'Cotton Yarn', 'Paper', 'Wood']
+INDUSTRIES = ['Automotive', 'Aerospace', 'General Engineering', 'Metal Fabrication',
+              'Packaging', 'Textiles', 'Food Processing', 'Electronics', 'Construction',
+              'Furniture', 'Pharmaceuticals', 'Appliances']
+AUTOMATION_LEVELS = [('Manual', 30), ('Semi-Automatic', 45), ('Fully Automatic', 25)]
+BUSINESS_SIZES = [('Small MSME (10-50 employees)', 50), ('Medium Unit (50-200 employees)', 35),
+                  ('Large Enterprise (200+ employees)', 15)]
+CITIES = ['Pune, Maharashtra', 'Gurgaon, Haryana', 'Ahmedabad, Gujarat', 'Chennai, Tamil Nadu',
+          'Coimbatore, Tamil Nadu', 'Ludhiana, Punjab', 'Rajkot, Gujarat', 'Bengaluru, Karnataka',
+          'Kolkata, West Bengal', 'Faridabad, Haryana', 'Nashik, Maharashtra', 'Hyderabad, Telangana']
+STATUSES = [('pending', 60), ('responded', 30), ('closed', 10)]
+
+def format_inr(amount):
+    """Format rupees with Indian digit grouping, e.g. 1500000 -> '₹15,00,000'"""
+    digits = str(int(amount))
+    if len(digits) > 3:
+        head, tail = digits[:-3], digits[-3:]
+        groups = []
+        while len(head) > 2:
+            groups.insert(0, head[-2:])
+            head = head[:-2]
+        if head:
+            groups.insert(0, head)
+        digits = ','.join(groups + [tail])
+    return f'₹{digits}'
+
+def _round_price(amount):
+    step = 50_000 if amount >= 1_000_000 else 10_000
+    return max(step, int(round(amount / step)) * step)
+
+def _weighted(choices, rng):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights=weights)[0]
+
+def _random_datetime(rng, start, span_seconds):
+    return start + timedelta(seconds=rng.random() * span_seconds)
+
+def _next_id(model):
+    return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+def _insert_batches(table, rows, batch_size, label, total):
+    """Insert rows from an iterator in batches, one transaction per batch"""
+    started = time.monotonic()
+    done = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            with db.engine.begin() as conn:
+                conn.execute(insert(table), batch)
+            done += len(batch)
+            batch = []
+            rate = done / max(time.monotonic() - started, 1e-9)
+            print(f"  {label}: {done:,}/{total:,} ({rate * 60:,.0f} rows/min)", end='\r')
+    if batch:
+        with db.engine.begin() as conn:
+            conn.execute(insert(table), batch)
+        done += len(batch)
+    elapsed = time.monotonic() - started
+    print(f"  {label}: {done:,} rows in {elapsed:.1f}s ({done / max(elapsed, 1e-9) * 60:,.0f} rows/min)")
+
+def _user_rows(first_id, count, role, password_hash, rng, start, span):
+    for offset in range(count):
+        user_id = first_id + offset
+        yield {
+            'id': user_id,
+            'name': f'{rng.choice(BRANDS)} {role.title()} {user_id}',
+            'email': f'{role}{user_id}@example.com',
+            'password_hash': password_hash,
+            'role': role,
+            'company_name': f'{rng.choice(BRANDS)} {rng.choice(INDUSTRIES)} Pvt Ltd',
+            'city': rng.choice(CITIES).split(',')[0],
+            'industry': rng.choice(INDUSTRIES),
+            'version': 1,
+            'created_at': _random_datetime(rng, start, span),
+        }
+
+def _machine_rows(first_id, count, supplier_ids, rng, start, span):
+    category_weights = [weight for _, weight, _, _ in CATEGORIES]
+    # Supplier catalog sizes follow a long tail: a few suppliers list most machines
+    supplier_weights = [rng.paretovariate(1.2) for _ in supplier_ids]
+    cum_suppliers = list(_cumulative(supplier_weights))
+    for offset in range(count):
+        machine_id = first_id + offset
+        category, _, typical_price, use_case = rng.choices(CATEGORIES, weights=category_weights)[0]
+        low = _round_price(typical_price * rng.lognormvariate(0, 0.5))
+        high = _round_price(low * rng.uniform(1.2, 1.8))
+        capacity = rng.choice([100, 200, 300, 500, 800, 1000, 2000])
+        kw = rng.choice([2.2, 3.7, 5, 7.5, 10, 15, 20, 30, 45])
+        power = rng.choice([f'440V, 3 Phase, {kw} kW', f'230V, Single Phase, {kw} kW',
+                            f'{round(kw / KW_PER_HP, 1)} HP'])
+        materials = ', '.join(rng.sample(MATERIALS, rng.randint(1, 3)))
+        industries = ', '.join(rng.sample(INDUSTRIES, rng.randint(1, 3)))
+        created_at = _random_datetime(rng, start, span)
+        image = f'https://via.placeholder.com/600x400?text=Machine+{machine_id}'
+        yield {
+            'id': machine_id,
+            'supplier_id': supplier_ids[bisect.bisect_left(cum_suppliers, rng.random() * cum_suppliers[-1])],
+            'name': f'{rng.choice(ADJECTIVES)} {category[:-1] if category.endswith("s") else category} {rng.choice(BRANDS)} {machine_id}',
+            'category': category,
+            'use_case': use_case,
+            'price_range': f'{format_inr(low)} - {format_inr(high)}',
+            'description': (f'{rng.choice(ADJECTIVES)} {category.lower()} for {use_case.lower()}. '
+                            f'Works with {materials.lower()} and suits {industries.lower()} units.'),
+            'image_front': image,
+            'production_capacity': f'{capacity}-{capacity * 2} units per 8-hour shift',
+            'automation_level': _weighted(AUTOMATION_LEVELS, rng),
+            'power_requirement': power,
+            'machine_dimensions': f'{rng.randint(2, 15)}ft × {rng.randint(2, 10)}ft × {rng.randint(3, 8)}ft (L×W×H)',
+            'raw_material': materials,
+            'operator_skill': rng.choice(['Skilled operator required', 'Semi-skilled technician required',
+                                          'Minimal training required']),
+            'warranty_info': f'{rng.choice([1, 1, 2, 3])} year manufacturer warranty',
+            'ideal_industry': industries,
+            'business_size_fit': _weighted(BUSINESS_SIZES, rng),
+            'installation_support': rng.choice(['yes', 'yes', 'no']),
+            'price_min': low,
+            'price_max': high,
+            'power_kw': parse_power_kw(power),
+            'capacity_per_shift': capacity,
+            'created_at': created_at,
+            'updated_at': created_at,
+        }
+
+def _enquiry_rows(first_id, count, machine_ids, buyer_ids, rng, start, span):
+    # Enquiry fan-out is heavily skewed: most machines get a handful, a few get thousands
+    cum_machines = list(_cumulative(min(rng.paretovariate(1.1), MAX_ENQUIRY_WEIGHT) for _ in machine_ids))
+    status_values, status_weights = zip(*STATUSES)
+    for offset in range(count):
+        machine_id = machine_ids[bisect.bisect_left(cum_machines, rng.random() * cum_machines[-1])]
+        budget = _round_price(rng.choice([300_000, 800_000, 1_500_000, 2_500_000]) * rng.uniform(0.7, 1.5))
+        yield {
+            'id': first_id + offset,
+            'buyer_id': rng.choice(buyer_ids),
+            'machine_id': machine_id,
+            'message': f'We are interested in machine #{machine_id}. Please share pricing, delivery timeline and service terms.',
+            'budget': format_inr(budget),
+            'location': rng.choice(CITIES),
+            'production_need': f'Around {rng.choice([100, 250, 500, 1000, 2500])} units per day',
+            'status': rng.choices(status_values, weights=status_weights)[0],
+            'created_at': _random_datetime(rng, start, span),
+        }
+
+def _cumulative(weights):
+    total = 0.0
+    for weight in weights:
+        total += weight
+        yield total
+
+def _reset_sequences():
+    """Move PostgreSQL id sequences past the explicitly inserted ids"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    with db.engine.begin() as conn:
+        for table in ('users', 'machines', 'enquiries'):
+            conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                              f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"))
+
+def generate(suppliers=500, buyers=2000, machines=10_000, enquiries=50_000,
+             batch_size=10_000, seed=42, days=730):
+    """Append a synthetic dataset of the given size to the current database"""
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(GENERATED_PASSWORD)
+    start = datetime.utcnow() - timedelta(days=days)
+    span = days * 86400
+
+    # The search index is rebuilt in one pass afterwards, which is much
+    # faster than maintaining it row by row during the load
+    drop_search()
+
+    first_user = _next_id(User)
+    supplier_ids = list(range(first_user, first_user + suppliers))
+    buyer_ids = list(range(first_user + suppliers, first_user + suppliers + buyers))
+    _insert_batches(User.__table__, _user_rows(first_user, suppliers, 'supplier', password_hash, rng, start, span),
+                    batch_size, 'suppliers', suppliers)
+    _insert_batches(User.__table__, _user_rows(buyer_ids[0] if buyers else 0, buyers, 'buyer', password_hash, rng, start, span),
+                    batch_size, 'buyers', buyers)
+
+    first_machine = _next_id(Machine)
+    machine_ids = list(range(first_machine, first_machine + machines))
+    if supplier_ids:
+        _insert_batches(Machine.__table__, _machine_rows(first_machine, machines, supplier_ids, rng, start, span),
+                        batch_size, 'machines', machines)
+
+    if machine_ids and buyer_ids and supplier_ids:
+        _insert_batches(Enquiry.__table__,
+                        _enquiry_rows(_next_id(Enquiry), enquiries, machine_ids, buyer_ids, rng, start, span),
+                        batch_size, 'enquiries', enquiries)
+
+    _reset_sequences()
+    print("  rebuilding search index...")
+    init_search()
+    print("  rebuilding dashboard rollups...")
+    rebuild_rollups()
+    print(f"Generated users share the password '{GENERATED_PASSWORD}'")
@@ -0,0 +1,141 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from models import db, User, Machine, Enquiry
+from archive import enquiry_source
+
+# Streaming enquiry exports for CRMs.
+# export_rows() yields the output in chunks of roughly FLUSH_BYTES while the
+# query is still running: the rows come from a server-side cursor
+# (stream_results) fetched EXPORT_BATCH at a time, so memory stays the same
+# whatever the number of rows. The CSV header (and the gzip header) is sent
+# before the query runs, which keeps the time to first byte low. With gzip
+# the chunks are compressed as they go.
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+
+EXPORT_BATCH = 1000
+FLUSH_BYTES = 64 * 1024
+
+Buyer = aliased(User, name='buyer')
+Supplier = aliased(User, name='supplier')
+
+def export_columns(enquiry=Enquiry):
+    """(output column, expression) pairs, reading enquiry fields from `enquiry`"""
+    return [
+        ('enquiry_id', enquiry.id),
+        ('created_at', enquiry.created_at),
+        ('status', enquiry.status),
+        ('budget', enquiry.budget),
+        ('location', enquiry.location),
+        ('production_need', enquiry.production_need),
+        ('message', enquiry.message),
+        ('machine_id', Machine.id),
+        ('machine_name', Machine.name),
+        ('machine_category', Machine.category),
+        ('machine_price_range', Machine.price_range),
+        ('supplier_id', Supplier.id),
+        ('supplier_name', Supplier.name),
+        ('supplier_company', Supplier.company_name),
+        ('buyer_id', Buyer.id),
+        ('buyer_name', Buyer.name),
+        ('buyer_email', Buyer.email),
+        ('buyer_phone', Buyer.phone),
+        ('buyer_company', Buyer.company_name),
+        ('buyer_city', Buyer.city),
+    ]
+
+EXPORT_COLUMNS = export_columns()
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD filter value, returning None if it is invalid"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+def export_query(supplier_id=None, status=None, start=None, end=None, history=False):
+    """Return the export statement, oldest enquiries first
+
+    `supplier_id` limits it to that supplier's machines; `start` and `end`
+    are dates, both inclusive. `history` includes archived enquiries.
+    """
+    enquiry = enquiry_source(history)
+    statement = select(*[expression for _, expression in export_columns(enquiry)]) \
+        .select_from(enquiry) \
+        .join(Machine, Machine.id == enquiry.machine_id) \
+        .join(Supplier, Supplier.id == Machine.supplier_id) \
+        .join(Buyer, Buyer.id == enquiry.buyer_id)
+    if supplier_id is not None:
+        statement = statement.where(Machine.supplier_id == supplier_id)
+    if status:
+        statement = statement.where(enquiry.status == status)
+    if start:
+        statement = statement.where(enquiry.created_at >= start)
+    if end:
+        statement = statement.where(enquiry.created_at < end + timedelta(days=1))
+    return statement.order_by(enquiry.created_at, enquiry.id)
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    value = str(value)
+    # Spreadsheets would run a cell starting with these as a formula
+    if value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([_text(value) for value in row])
+        yield buffer.getvalue()
+
+def _jsonl_lines(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    yield ''
+    for row in rows:
+        record = {name: value.isoformat() if isinstance(value, datetime) else value
+                  for name, value in zip(names, row)}
+        yield json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+def _rows(statement):
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH).execute(statement)
+        yield from result
+
+def export_rows(statement, export_format='csv', compress=False):
+    """Yield the encoded export of `statement` in chunks"""
+    lines = (_csv_lines if export_format == 'csv' else _jsonl_lines)(_rows(statement))
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    pending, size = [], 0
+    for index, line in enumerate(lines):
+        pending.append(line)
+        size += len(line)
+        # Send the header right away, then whole chunks
+        if index == 0 or size >= FLUSH_BYTES:
+            data = ''.join(pending).encode('utf-8')
+            pending, size = [], 0
+            if compressor:
+                data = compressor.compress(data) + (compressor.flush(zlib.Z_SYNC_FLUSH) if index == 0 else b'')
+            if data:
+                yield data
+    data = ''.join(pending).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
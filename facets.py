@@ -0,0 +1,54 @@
+import os
+from sqlalchemy import func
+from cache import TTLCache
+from models import db, Machine
+from search import apply_search
+from specs import apply_ranges
+
+# Catalog facets: the distinct values of a few Machine columns together with
+# how many machines have each value, restricted by the active search,
+# filters and price/power/capacity ranges. Each facet ignores its own filter
+# so the sidebar keeps showing the alternatives to the current selection.
+#
+# Results are cached in-process for FACET_CACHE_TTL seconds. Adding a
+# machine clears this worker's cache; other workers catch up within the TTL.
+
+FACET_FIELDS = ['category', 'automation_level', 'business_size_fit']
+
+facet_cache = TTLCache(ttl=int(os.getenv('FACET_CACHE_TTL', 300)), max_entries=512)
+
+def _normalize_search(search):
+    return ' '.join(search.lower().split()) if search else ''
+
+def _facet_counts(field, filters, search, ranges):
+    column = getattr(Machine, field)
+    query = db.session.query(Machine)
+    for other, value in filters.items():
+        if other != field and value:
+            query = query.filter(getattr(Machine, other) == value)
+    query = apply_ranges(query, ranges)
+    if search:
+        query, _ = apply_search(query, search)
+    rows = query.with_entities(column, func.count(Machine.id)) \
+        .filter(column.isnot(None), column != '') \
+        .group_by(column) \
+        .order_by(column) \
+        .all()
+    return [(value, count) for value, count in rows]
+
+def get_facets(filters, search=None, ranges=None):
+    """Return {field: [(value, count), ...]} for every facet field
+
+    `filters` maps facet fields to the currently selected value (or None);
+    `ranges` holds the parsed range filters from specs.parse_ranges().
+    """
+    search = _normalize_search(search)
+    ranges = ranges or {}
+    key = (tuple(filters.get(field) or '' for field in FACET_FIELDS), search,
+           tuple(sorted(ranges.items())))
+    return facet_cache.get_or_set(
+        key, lambda: {field: _facet_counts(field, filters, search, ranges) for field in FACET_FIELDS})
+
+def invalidate_facets():
+    """Drop cached facet counts after the catalog changes"""
+    facet_cache.clear()
@@ -0,0 +1,59 @@
+# Gunicorn configuration
+#   gunicorn -c gunicorn.conf.py "app:create_app()"
+import multiprocessing
+import os
+import shutil
+import tempfile
+from dotenv import load_dotenv
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Threaded workers: requests mostly wait on the database, so a few threads
+# per process keep the CPU busy without multiplying memory per worker.
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+
+# Import the app once in the master and fork it into the workers, instead
+# of every worker importing it on its own
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to bound memory growth
+max_requests = 1000
+max_requests_jitter = 100
+
+accesslog = '-'
+
+# Prometheus multiprocess mode (see metrics.py), so /metrics aggregates every
+# worker. prometheus_client reads the variable when it is imported, which
+# preload_app does before any server hook runs, so it is set here.
+load_dotenv()
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'b2b-metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+def on_starting(server):
+    """Start from an empty metrics directory, dropping files of earlier runs"""
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+def post_fork(server, worker):
+    """Drop pooled connections inherited from the master so workers never share a socket"""
+    from models import db
+    app = server.app.wsgi()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+def child_exit(server, worker):
+    """Drop an exited worker's live metric files (see metrics.py)"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,267 @@
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import os
+import socket
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from urllib.parse import urlsplit
+from urllib.request import HTTPRedirectHandler, Request, build_opener
+from flask import current_app, url_for
+from PIL import Image, ImageOps
+from cache import TTLCache
+from metrics import IMAGE_PROXY_REQUESTS
+
+# Caching proxy for machine photos hosted elsewhere.
+# Machine image fields hold arbitrary external URLs. Templates pass them
+# through proxied_image(), which points at /image-proxy/<size> with the URL
+# and an HMAC of it, so the endpoint only fetches URLs this app put in a
+# page. The first request downloads the image once, scales it to fit every
+# PROXY_SIZES box and stores each as WebP in IMAGE_CACHE_DIR; later requests
+# are served from those files with a strong ETag (a hash of the bytes) and a
+# long max-age.
+#
+# The cache directory is bounded by IMAGE_CACHE_MAX_MB. Each process keeps
+# an in-memory LRU index of the files (name -> bytes, ETag), built from a
+# scan of the directory on first use, and deletes the least recently used
+# files once a new one takes it over the bound. Files written or deleted by
+# other workers are picked up on lookup. Concurrent requests for the same
+# URL in one process wait for a single download; a URL that failed is not
+# tried again for FAILURE_TTL seconds.
+#
+# Only http(s) URLs that resolve to public addresses are fetched, and
+# redirects are checked the same way. IMAGE_PROXY_ALLOW_PRIVATE lifts that
+# for testing against a local server.
+
+# Bounding boxes: detail page thumbnails, catalog cards and the gallery, at 2x
+PROXY_SIZES = {'thumb': (160, 120), 'card': (600, 400), 'gallery': (1200, 900)}
+
+WEBP_QUALITY = 80
+MAX_PIXELS = 40_000_000
+FAILURE_TTL = 300
+USER_AGENT = 'B2B-Platform-ImageProxy/1.0'
+
+def sign_url(url):
+    return hmac.new(current_app.secret_key.encode(), url.encode(), hashlib.sha256).hexdigest()[:32]
+
+def valid_signature(url, signature):
+    return hmac.compare_digest(sign_url(url), signature or '')
+
+def proxied_image(url, size='card'):
+    """URL that shows an external image at one of the PROXY_SIZES
+
+    Anything that is not an http(s) URL, or every URL when the proxy is
+    disabled, is returned unchanged.
+    """
+    if not url or not current_app.config['IMAGE_PROXY_ENABLED'] or urlsplit(url).scheme not in ('http', 'https'):
+        return url
+    return url_for('image_proxy', size=size, url=url, sig=sign_url(url))
+
+def _check_url(url):
+    """Raise ValueError unless `url` may be fetched"""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError(f'Unsupported image URL {url}')
+    if current_app.config['IMAGE_PROXY_ALLOW_PRIVATE']:
+        return
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    for *_, sockaddr in socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM):
+        if not ipaddress.ip_address(sockaddr[0]).is_global:
+            raise ValueError(f'{parts.hostname} is not a public address')
+
+class _CheckedRedirects(HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        _check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+def _download(url):
+    _check_url(url)
+    limit = current_app.config['IMAGE_PROXY_MAX_MB'] * 1024 * 1024
+    request = Request(url, headers={'User-Agent': USER_AGENT, 'Accept': 'image/*'})
+    with build_opener(_CheckedRedirects).open(request, timeout=current_app.config['IMAGE_PROXY_TIMEOUT']) as response:
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > limit:
+            raise ValueError(f'Image at {url} is larger than {limit} bytes')
+        data = response.read(limit + 1)
+    if len(data) > limit:
+        raise ValueError(f'Image at {url} is larger than {limit} bytes')
+    return data
+
+def _resize(data):
+    """Return {size: WebP bytes} for every PROXY_SIZES box, decoding `data` once"""
+    largest = max(PROXY_SIZES.values())
+    try:
+        with Image.open(BytesIO(data)) as image:
+            if image.width * image.height > MAX_PIXELS:
+                raise ValueError('Image dimensions are too large')
+            # JPEGs are decoded at the smallest scale that still covers the largest box
+            image.draft('RGB', largest)
+            image = ImageOps.exif_transpose(image)
+            transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if transparent else 'RGB')
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f'Unreadable image: {e}')
+    variants = {}
+    for size, box in sorted(PROXY_SIZES.items(), key=lambda item: -item[1][0]):
+        image.thumbnail(box, Image.LANCZOS)  # in place, never enlarges
+        buffer = BytesIO()
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+        variants[size] = buffer.getvalue()
+    return variants
+
+def _file_name(url, size):
+    return f"{hashlib.sha256(url.encode()).hexdigest()}-{size}.webp"
+
+def _etag(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+class ImageCache:
+    """Size-bounded directory of proxied images with an in-memory LRU index"""
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.max_bytes = 0
+        self._index = None  # name -> [bytes, etag], least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._failures = TTLCache(ttl=FAILURE_TTL, max_entries=4096)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('IMAGE_CACHE_DIR') or os.path.join(app.instance_path, 'image_cache')
+        self.max_bytes = int(app.config.setdefault('IMAGE_CACHE_MAX_MB', 512)) * 1024 * 1024
+        self._index = None
+        self._bytes = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _load_index(self):
+        # Called with the lock held, on first use in each process
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.webp'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        self._index = OrderedDict()
+        self._bytes = 0
+        for _, name, size in sorted(entries):
+            self._index[name] = [size, None]
+            self._bytes += size
+
+    def _add(self, name, size, etag):
+        # Called with the lock held; returns the files to delete
+        if self._index is None:
+            self._load_index()
+        old = self._index.pop(name, None)
+        if old:
+            self._bytes -= old[0]
+        self._index[name] = [size, etag]
+        self._bytes += size
+        evicted = []
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            evicted_name, (evicted_size, _) = self._index.popitem(last=False)
+            self._bytes -= evicted_size
+            evicted.append(evicted_name)
+        return evicted
+
+    def _forget(self, name):
+        with self._lock:
+            entry = self._index.pop(name, None) if self._index is not None else None
+            if entry:
+                self._bytes -= entry[0]
+
+    def _remove(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def open(self, name):
+        """Return (file, etag) of a cached image, or None if it is not cached"""
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            entry = self._index.get(name)
+            if entry is not None:
+                self._index.move_to_end(name)
+        try:
+            f = open(os.path.join(self.directory, name), 'rb')
+        except FileNotFoundError:
+            # Evicted by another worker
+            if entry is not None:
+                self._forget(name)
+            return None
+        if entry is None or entry[1] is None:
+            # Written by another worker, or indexed by the startup scan
+            data = f.read()
+            f.seek(0)
+            with self._lock:
+                evicted = self._add(name, len(data), _etag(data))
+                entry = self._index[name]
+            self._remove(evicted)
+        return f, entry[1]
+
+    def store(self, name, data):
+        path = os.path.join(self.directory, name)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            evicted = self._add(name, len(data), _etag(data))
+        self._remove(evicted)
+
+    def fetch(self, url):
+        """Download `url` and store all its sizes, unless another thread already is
+
+        Returns False if it failed now or within the last FAILURE_TTL seconds.
+        """
+        if self._failures.get(url):
+            return False
+        with self._lock:
+            done = self._inflight.get(url)
+            leader = done is None
+            if leader:
+                done = self._inflight[url] = threading.Event()
+        if not leader:
+            done.wait(current_app.config['IMAGE_PROXY_TIMEOUT'] * 2)
+            return not self._failures.get(url)
+        try:
+            for size, data in _resize(_download(url)).items():
+                self.store(_file_name(url, size), data)
+            return True
+        # HTTPException covers truncated bodies (IncompleteRead) and bad status lines
+        except (ValueError, OSError, http.client.HTTPException) as e:
+            current_app.logger.warning('Image proxy could not fetch %s: %s', url, e)
+            self._failures.set(url, True)
+            return False
+        finally:
+            with self._lock:
+                del self._inflight[url]
+            done.set()
+
+image_cache = ImageCache()
+
+def open_image(url, size):
+    """Return (file, etag) of `url` at `size`, fetching it on a miss
+
+    Returns None if the image cannot be fetched.
+    """
+    name = _file_name(url, size)
+    cached = image_cache.open(name)
+    if cached is not None:
+        IMAGE_PROXY_REQUESTS.labels(size, 'hit').inc()
+        return cached
+    if image_cache.fetch(url):
+        cached = image_cache.open(name)
+    IMAGE_PROXY_REQUESTS.labels(size, 'miss' if cached else 'error').inc()
+    return cached
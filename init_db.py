@@ -4,18 +4,44 @@ Database initialization script for B2B Manufacturing Platform
 Run this script to create the database tables and optionally add sample data
 """
 
-from app import app, db
-from models import User, Machine, Enquiry
+import argparse
+import os
+from app import create_app
+from models import db, User, Machine, Enquiry, ImportJob
+from search import drop_search
+from migrations import MIGRATIONS, ensure_schema, current_version
+from datagen import generate
+from specs import backfill_specs
+from similarity import build_index
+from matching import CHUNK_SIZE, build_recommendations
+from rollups import rebuild_rollups
+from machine_import import create_job, run_import
+from profile_images import collect_garbage
+from archive import ARCHIVE_BATCH, archive_enquiries
 from werkzeug.security import generate_password_hash
 from datetime import datetime
 
+app = create_app()
+
+def print_applied(applied):
+    for version, description, _ in MIGRATIONS:
+        if version in applied:
+            print(f"Applied migration {version}: {description}")
+
 def create_tables():
     """Create all database tables"""
     with app.app_context():
         print("Creating database tables...")
-        db.create_all()
+        print_applied(ensure_schema())
         print("Tables created successfully!")
 
+def migrate_database():
+    """Apply pending schema migrations to an existing database"""
+    with app.app_context():
+        print(f"Current schema version: {current_version()}")
+        print_applied(ensure_schema())
+        print(f"Schema version: {current_version()}")
+
 def add_sample_data():
     """Add sample data for testing"""
     with app.app_context():
@@ -228,11 +254,114 @@ def reset_database():
     """Reset database by dropping all tables and recreating them"""
     with app.app_context():
         print("Resetting database...")
+        drop_search()
         db.drop_all()
+        with db.engine.begin() as conn:
+            conn.execute(db.text("DROP TABLE IF EXISTS schema_migrations"))
         print("All tables dropped.")
         create_tables()
         print("Database reset complete!")
 
+def backfill_machine_specs():
+    """Re-parse numeric price, power and capacity values for every machine"""
+    with app.app_context():
+        print("Backfilling machine specs...")
+        updated = backfill_specs()
+        print(f"Updated {updated} machines")
+
+def build_similarity_index():
+    """Recompute the similar-machines index for the whole catalog"""
+    with app.app_context():
+        print("Building similarity index...")
+        stats = build_index()
+        print(f"Indexed {stats['machines']} machines over {stats['terms']} terms, "
+              f"{stats['links']} links in {stats['total_seconds']}s")
+
+def rebuild_dashboard_rollups():
+    """Recompute the admin dashboard counters from the base tables"""
+    with app.app_context():
+        print("Rebuilding dashboard rollups...")
+        rows = rebuild_rollups()
+        print(f"Wrote {rows} daily counters")
+
+def collect_profile_images():
+    """Convert old profile images and delete unreferenced image files"""
+    with app.app_context():
+        print("Collecting profile images...")
+        stats = collect_garbage()
+        print(f"Converted {stats['converted']} old images, deleted {stats['deleted']} unused files")
+
+def build_buyer_recommendations(args):
+    """Recompute the machine recommendations of every buyer"""
+    parser = argparse.ArgumentParser(prog='python init_db.py match')
+    parser.add_argument('--workers', type=int, help='scoring processes (default: one per core)')
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE, help='buyers per scoring task')
+    options = parser.parse_args(args)
+    with app.app_context():
+        print("Building buyer recommendations...")
+        stats = build_recommendations(workers=options.workers, chunk_size=options.chunk)
+        print(f"Wrote {stats['links']} recommendations for {stats['buyers']} buyers "
+              f"with {stats['workers']} workers in {stats['total_seconds']}s")
+
+def archive_old_enquiries(args):
+    """Move old closed enquiries to the archive table"""
+    parser = argparse.ArgumentParser(prog='python init_db.py archive')
+    parser.add_argument('--months', type=int, help='archive closed enquiries older than this '
+                        '(default: ENQUIRY_ARCHIVE_MONTHS)')
+    parser.add_argument('--batch', type=int, default=ARCHIVE_BATCH, help='enquiries per transaction')
+    parser.add_argument('--pause', type=float, default=0.1, help='seconds to wait between batches')
+    options = parser.parse_args(args)
+    with app.app_context():
+        print("Archiving old closed enquiries...")
+        moved = archive_enquiries(months=options.months, batch_size=options.batch, pause=options.pause,
+                                  progress=lambda moved: print(f"  {moved} moved"))
+        print(f"Archived {moved} enquiries")
+
+def import_machines(args):
+    """Import machines for a supplier from a CSV or XLSX file"""
+    parser = argparse.ArgumentParser(prog='python init_db.py import')
+    parser.add_argument('file', nargs='?', help='CSV or XLSX file with a header row of machine fields')
+    parser.add_argument('--supplier', help='supplier id or email')
+    parser.add_argument('--resume', type=int, metavar='JOB_ID', help='continue an interrupted import job')
+    options = parser.parse_args(args)
+    if not options.resume and not (options.file and options.supplier):
+        parser.error('give a file and --supplier, or --resume JOB_ID')
+    with app.app_context():
+        if options.resume:
+            job_id = options.resume
+        else:
+            if options.supplier.isdigit():
+                supplier = db.session.get(User, int(options.supplier))
+            else:
+                supplier = User.query.filter_by(email=options.supplier).first()
+            if supplier is None or supplier.role != 'supplier':
+                parser.error(f"no supplier {options.supplier}")
+            job_id = create_job(supplier.id, os.path.basename(options.file), os.path.abspath(options.file)).id
+        print(f"Import job {job_id}...")
+        status = run_import(job_id, progress=lambda job: print(
+            f"  {job.rows_done}/{job.total_rows} rows, {job.imported} imported, {job.failed} rejected"))
+        job = db.session.get(ImportJob, job_id)
+        print(f"Import {status}" + (f": {job.message}" if job.message else ""))
+
+def generate_data(args):
+    """Append a large synthetic dataset for scale testing"""
+    parser = argparse.ArgumentParser(prog='python init_db.py generate')
+    parser.add_argument('--suppliers', type=int, default=500)
+    parser.add_argument('--buyers', type=int, default=2000)
+    parser.add_argument('--machines', type=int, default=10_000)
+    parser.add_argument('--enquiries', type=int, default=50_000)
+    parser.add_argument('--batch', type=int, default=10_000, help='rows per insert batch')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--days', type=int, default=730, help='spread created_at over this many days')
+    options = parser.parse_args(args)
+    with app.app_context():
+        print_applied(ensure_schema())
+        print("Generating synthetic data...")
+        generate(suppliers=options.suppliers, buyers=options.buyers, machines=options.machines,
+                 enquiries=options.enquiries, batch_size=options.batch, seed=options.seed,
+                 days=options.days)
+        print("Synthetic data generated!")
+
 if __name__ == '__main__':
     import sys
     
@@ -248,15 +377,51 @@ if __name__ == '__main__':
         elif command == 'full':
             reset_database()
             add_sample_data()
+        elif command == 'migrate':
+            migrate_database()
+        elif command == 'backfill':
+            backfill_machine_specs()
+        elif command == 'similarity':
+            build_similarity_index()
+        elif command == 'rollups':
+            rebuild_dashboard_rollups()
+        elif command == 'images':
+            collect_profile_images()
+        elif command == 'match':
+            build_buyer_recommendations(sys.argv[2:])
+        elif command == 'archive':
+            archive_old_enquiries(sys.argv[2:])
+        elif command == 'import':
+            import_machines(sys.argv[2:])
+        elif command == 'generate':
+            generate_data(sys.argv[2:])
         else:
-            print("Usage: python init_db.py [init|sample|reset|full]")
+            print("Usage: python init_db.py [init|sample|reset|full|migrate|backfill|similarity|match|rollups|images|archive|import|generate]")
             print("init - Create tables only")
             print("sample - Add sample data")
             print("reset - Drop and recreate tables")
             print("full - Reset database and add sample data")
+            print("migrate - Apply pending schema migrations")
+            print("backfill - Re-parse numeric price/power/capacity columns")
+            print("similarity - Rebuild the similar-machines index")
+            print("match - Rebuild buyer recommendations (see --help)")
+            print("rollups - Rebuild the admin dashboard counters")
+            print("images - Convert old profile images and delete unused image files")
+            print("archive - Move old closed enquiries to the archive table (see --help)")
+            print("import - Import machines from a CSV or XLSX file (see --help)")
+            print("generate - Append synthetic data for scale testing (see --help)")
     else:
-        print("Usage: python init_db.py [init|sample|reset|full]")
+        print("Usage: python init_db.py [init|sample|reset|full|migrate|backfill|similarity|match|rollups|images|archive|import|generate]")
         print("init - Create tables only")
         print("sample - Add sample data")
         print("reset - Drop and recreate tables")
         print("full - Reset database and add sample data")
+        print("migrate - Apply pending schema migrations")
+        print("backfill - Re-parse numeric price/power/capacity columns")
+        print("similarity - Rebuild the similar-machines index")
+        print("match - Rebuild buyer recommendations (see --help)")
+        print("rollups - Rebuild the admin dashboard counters")
+        print("images - Convert old profile images and delete unused image files")
+        print("archive - Move old closed enquiries to the archive table (see --help)")
+        print("import - Import machines from a CSV or XLSX file (see --help)")
+        print("generate - Append synthetic data for scale testing (see --help)")
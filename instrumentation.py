@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import time
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from models import db
+
+# Per-request timing instrumentation.
+# When enabled, every request records its SQL statement count, total and
+# slowest statement time, template render time and total handler time, and
+# reports them in a Server-Timing response header. Statements slower than
+# SLOW_QUERY_MS are written to the 'slow_queries' log with their parameters.
+#
+# The on/off switch and threshold live in a small JSON file in the instance
+# folder so a change made in one gunicorn worker reaches all of them
+# without a restart.
+
+slow_query_log = logging.getLogger('slow_queries')
+
+SETTINGS_CHECK_INTERVAL = 1.0  # seconds between checks of the settings file
+
+_state = {
+    'enabled': False,
+    'slow_query_ms': 200.0,
+    'settings_file': None,
+    'settings_mtime': None,
+    'last_check': 0.0,
+}
+
+def init_instrumentation(app):
+    """Attach the instrumentation hooks to the app and its database engines"""
+    _state['enabled'] = app.config.setdefault('INSTRUMENTATION_ENABLED', False)
+    _state['slow_query_ms'] = float(app.config.setdefault('SLOW_QUERY_MS', 200))
+    _state['settings_file'] = os.path.join(app.instance_path, 'instrumentation.json')
+
+    if not slow_query_log.handlers:
+        log_file = app.config.get('SLOW_QUERY_LOG_FILE')
+        handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+        slow_query_log.addHandler(handler)
+        slow_query_log.setLevel(logging.INFO)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_engine(engine)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+def instrument_engine(engine):
+    """Time every statement executed on `engine`"""
+    if event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+def set_instrumentation(enabled=None, slow_query_ms=None):
+    """Change the settings for this and every other worker process"""
+    if enabled is not None:
+        _state['enabled'] = bool(enabled)
+    if slow_query_ms is not None:
+        _state['slow_query_ms'] = float(slow_query_ms)
+    path = _state['settings_file']
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'enabled': _state['enabled'], 'slow_query_ms': _state['slow_query_ms']}, f)
+        os.replace(tmp_path, path)
+        _state['settings_mtime'] = os.stat(path).st_mtime
+
+def get_settings():
+    """Return the current settings of this worker"""
+    return {'enabled': _state['enabled'], 'slow_query_ms': _state['slow_query_ms']}
+
+def _refresh_settings():
+    """Reload the shared settings file if another worker changed it"""
+    now = time.monotonic()
+    if now - _state['last_check'] < SETTINGS_CHECK_INTERVAL:
+        return
+    _state['last_check'] = now
+    path = _state['settings_file']
+    try:
+        mtime = os.stat(path).st_mtime
+    except (OSError, TypeError):
+        return
+    if mtime == _state['settings_mtime']:
+        return
+    try:
+        with open(path) as f:
+            settings = json.load(f)
+    except (OSError, ValueError):
+        return
+    _state['settings_mtime'] = mtime
+    _state['enabled'] = bool(settings.get('enabled', _state['enabled']))
+    _state['slow_query_ms'] = float(settings.get('slow_query_ms', _state['slow_query_ms']))
+
+def _start_request():
+    _refresh_settings()
+    if not _state['enabled']:
+        return
+    g.timing = {
+        'start': time.perf_counter(),
+        'sql_count': 0,
+        'sql_time': 0.0,
+        'sql_max': 0.0,
+        'render_time': 0.0,
+        'render_start': [],
+    }
+
+def _finish_request(response):
+    timing = g.pop('timing', None)
+    if timing is None:
+        return response
+    total = time.perf_counter() - timing['start']
+    metrics = [
+        f'db;dur={timing["sql_time"] * 1000:.1f};desc="{timing["sql_count"]} queries"',
+        f'db-max;dur={timing["sql_max"] * 1000:.1f}',
+        f'render;dur={timing["render_time"] * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ]
+    response.headers.add('Server-Timing', ', '.join(metrics))
+    return response
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start', None)
+    if start is None or not has_request_context():
+        return
+    timing = g.get('timing')
+    if timing is None:
+        return
+    elapsed = time.perf_counter() - start
+    timing['sql_count'] += 1
+    timing['sql_time'] += elapsed
+    timing['sql_max'] = max(timing['sql_max'], elapsed)
+    if elapsed * 1000 >= _state['slow_query_ms']:
+        slow_query_log.warning('%.1f ms [%s] %s params=%r',
+                               elapsed * 1000, request.endpoint, statement, parameters)
+
+def _before_render(sender, template, context, **extra):
+    timing = g.get('timing')
+    if timing is not None:
+        timing['render_start'].append(time.perf_counter())
+
+def _after_render(sender, template, context, **extra):
+    timing = g.get('timing')
+    if timing is not None and timing['render_start']:
+        timing['render_time'] += time.perf_counter() - timing['render_start'].pop()
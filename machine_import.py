@@ -0,0 +1,277 @@
+import csv
+import os
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter
+from datetime import datetime, timedelta
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from sqlalchemy import insert, select, update
+from models import db, Machine, ImportJob, ImportRowError
+from rollups import add_counts
+from specs import machine_specs
+
+# Bulk machine import for suppliers.
+# An uploaded CSV or XLSX file (header row of Machine field names, then one
+# machine per row) is stored and recorded as an ImportJob. run_import()
+# streams it row by row, validates each row like add_machine() does and
+# inserts the valid ones with batched Core statements, CHUNK_ROWS rows per
+# transaction. Rejected rows go to import_row_errors and do not stop the
+# import. Only one chunk is held in memory, whatever the file size.
+#
+# Each chunk commits together with the job's progress counters, so an
+# interrupted job can be re-run and continues after its last committed row.
+# Imports run on a thread of the web worker that received the upload, and
+# gunicorn recycles workers now and then. Every commit refreshes the job's
+# updated_at; with IMPORT_WATCHDOG_ENABLED, a watchdog thread in each worker
+# resumes jobs that have not moved for IMPORT_STALE_SECONDS. A chunk only commits if the job's
+# rows_done is still what its runner last wrote, so a runner that was only
+# slow, not dead, stops instead of importing rows twice.
+# Imported machines skip the ORM, so they are only added to the similarity
+# index by its next full build.
+
+REQUIRED_FIELDS = ['name', 'category', 'use_case', 'price_range', 'description']
+IMAGE_FIELDS = ['image_front', 'image_side', 'image_working', 'image_closeup']
+MACHINE_FIELDS = REQUIRED_FIELDS + [
+    'production_capacity', 'automation_level', 'power_requirement', 'machine_dimensions',
+    'raw_material', 'operator_skill', 'warranty_info', 'ideal_industry', 'business_size_fit',
+    'installation_support',
+] + IMAGE_FIELDS
+
+IMPORT_EXTENSIONS = {'csv', 'xlsx'}
+
+CHUNK_ROWS = 1000
+
+ACTIVE_STATUSES = ['queued', 'running']
+
+class ImportTakenOver(Exception):
+    """Another runner resumed the job (see init_import_watchdog)"""
+
+# Errors that make the whole file unreadable, as opposed to a bad row
+FILE_ERRORS = (ValueError, UnicodeDecodeError, csv.Error, OSError, zipfile.BadZipFile, InvalidFileException)
+
+def allowed_import(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMPORT_EXTENSIONS
+
+def validate_machine(values):
+    """Return why `values` ({field: text}) cannot be saved as a machine, or None"""
+    if not all(values.get(field) for field in REQUIRED_FIELDS):
+        return 'All basic fields are required'
+    if not any(values.get(field) for field in IMAGE_FIELDS):
+        return 'At least one machine image is required'
+    for field in MACHINE_FIELDS:
+        limit = Machine.__table__.c[field].type.length
+        if limit and values.get(field) and len(values[field]) > limit:
+            return f'{field} is longer than {limit} characters'
+    return None
+
+def _csv_rows(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        yield from csv.reader(f)
+
+def _xlsx_rows(path):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ['' if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+def _file_rows(path):
+    return _xlsx_rows(path) if path.lower().endswith('.xlsx') else _csv_rows(path)
+
+def count_rows(path):
+    """Return the number of data rows below the header"""
+    if path.lower().endswith('.xlsx'):
+        workbook = load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        if max_row is not None:
+            return max(max_row - 1, 0)
+    return max(sum(1 for _ in _file_rows(path)) - 1, 0)
+
+def read_rows(path):
+    """Yield (row_number, {field: value}) for each data row of a CSV or XLSX file
+
+    Row 1 is the header; its names are matched to Machine fields ignoring
+    case and spaces, and other columns are ignored. Blank rows are skipped.
+    Raises ValueError if a required column is missing.
+    """
+    rows = _file_rows(path)
+    header = [name.strip().lower().replace(' ', '_') for name in next(rows, [])]
+    missing = [field for field in REQUIRED_FIELDS if field not in header]
+    if missing:
+        rows.close()
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    columns = [(index, name) for index, name in enumerate(header) if name in MACHINE_FIELDS]
+    for row_number, row in enumerate(rows, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        yield row_number, {name: row[index].strip() if index < len(row) else '' for index, name in columns}
+
+def _machine_row(supplier_id, values, now):
+    row = {field: values.get(field) or None for field in MACHINE_FIELDS}
+    row.update(machine_specs(row['price_range'], row['power_requirement'], row['production_capacity']))
+    row.update(supplier_id=supplier_id, created_at=now, updated_at=now)
+    return row
+
+def _update_job(conn, job_id, **values):
+    jobs = ImportJob.__table__
+    conn.execute(update(jobs).where(jobs.c.id == job_id).values(updated_at=datetime.utcnow(), **values))
+
+def _commit_chunk(job_id, machines, errors, previous_rows_done, rows_done, **job_values):
+    """Insert a chunk and advance the job's counters in one transaction
+
+    Raises ImportTakenOver, inserting nothing, if the job's rows_done is no
+    longer `previous_rows_done`.
+    """
+    jobs = ImportJob.__table__
+    with db.engine.begin() as conn:
+        # First, so that the job row stays locked until the chunk commits
+        advanced = conn.execute(
+            update(jobs).where(jobs.c.id == job_id, jobs.c.rows_done == previous_rows_done)
+            .values(updated_at=datetime.utcnow(), rows_done=rows_done, imported=jobs.c.imported + len(machines),
+                    failed=jobs.c.failed + len(errors), **job_values))
+        if advanced.rowcount == 0:
+            raise ImportTakenOver(job_id)
+        if machines:
+            conn.execute(insert(Machine.__table__), machines)
+            add_counts(conn, machines[0]['created_at'].date(),
+                       Counter(('machines', machine['category']) for machine in machines))
+        if errors:
+            conn.execute(insert(ImportRowError.__table__), errors)
+
+def create_job(supplier_id, filename, path):
+    """Queue an import of the file at `path` for a supplier"""
+    job = ImportJob(supplier_id=supplier_id, filename=filename[:255], path=path)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def save_upload(upload, folder):
+    """Store an uploaded file under `folder` and return its path"""
+    os.makedirs(folder, exist_ok=True)
+    extension = upload.filename.rsplit('.', 1)[1].lower()
+    path = os.path.join(folder, f'{uuid.uuid4().hex}.{extension}')
+    upload.save(path)
+    return path
+
+def run_import(job_id, progress=None):
+    """Import a job's file, continuing after its last committed row
+
+    `progress`, if given, is called with the job's counters after every
+    chunk. Returns the job's final status.
+    """
+    job = db.session.get(ImportJob, job_id)
+    supplier_id, path, skip = job.supplier_id, job.path, job.rows_done + 1
+    db.session.rollback()
+    try:
+        with db.engine.begin() as conn:
+            _update_job(conn, job_id, status='running', message=None, total_rows=count_rows(path))
+        machines, errors = [], []
+        rows_done = committed = skip - 1
+        now = datetime.utcnow()
+        for row_number, values in read_rows(path):
+            if row_number <= skip:
+                continue
+            error = validate_machine(values)
+            if error:
+                errors.append({'job_id': job_id, 'row_number': row_number, 'message': error})
+            else:
+                machines.append(_machine_row(supplier_id, values, now))
+            rows_done = row_number - 1
+            if len(machines) + len(errors) >= CHUNK_ROWS:
+                _commit_chunk(job_id, machines, errors, committed, rows_done)
+                committed = rows_done
+                machines, errors = [], []
+                now = datetime.utcnow()
+                if progress:
+                    progress(db.session.get(ImportJob, job_id, populate_existing=True))
+        _commit_chunk(job_id, machines, errors, committed, rows_done, status='done')
+    except ImportTakenOver:
+        return 'running'
+    except FILE_ERRORS as e:
+        with db.engine.begin() as conn:
+            _update_job(conn, job_id, status='failed', message=str(e)[:500])
+    except Exception as e:
+        with db.engine.begin() as conn:
+            _update_job(conn, job_id, status='failed', message=f'Import stopped: {e}'[:500])
+        raise
+    job = db.session.get(ImportJob, job_id, populate_existing=True)
+    if progress:
+        progress(job)
+    return job.status
+
+def start_import(app, job_id, on_finish=None):
+    """Run an import on a background thread of this process
+
+    The stored upload is deleted once the job is done; `on_finish` is
+    called afterwards in the app context.
+    """
+    def run():
+        with app.app_context():
+            status = run_import(job_id)
+            if status == 'done':
+                os.remove(db.session.get(ImportJob, job_id).path)
+            if on_finish:
+                on_finish()
+    thread = threading.Thread(target=run, name=f'machine-import-{job_id}', daemon=True)
+    thread.start()
+    return thread
+
+def claim_stale_jobs(stale_seconds):
+    """Take over queued or running jobs whose runner stopped, returning their ids
+
+    A job is stale when it has not been updated for `stale_seconds`.
+    Claiming refreshes updated_at, so only one process claims each job.
+    """
+    jobs = ImportJob.__table__
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_seconds)
+    stale = db.session.execute(
+        select(jobs.c.id).where(jobs.c.status.in_(ACTIVE_STATUSES), jobs.c.updated_at < cutoff)).scalars().all()
+    db.session.rollback()
+    claimed = []
+    for job_id in stale:
+        with db.engine.begin() as conn:
+            result = conn.execute(
+                update(jobs).where(jobs.c.id == job_id, jobs.c.status.in_(ACTIVE_STATUSES), jobs.c.updated_at < cutoff)
+                .values(updated_at=datetime.utcnow()))
+        if result.rowcount:
+            claimed.append(job_id)
+    return claimed
+
+def init_import_watchdog(app, on_finish=None):
+    """Resume imports abandoned by an exited worker, from a thread in each process
+
+    The thread is started by the first request a process handles, so that
+    it runs in every forked gunicorn worker rather than in the master. It is
+    off unless IMPORT_WATCHDOG_ENABLED is set.
+    """
+    if not app.config.get('IMPORT_WATCHDOG_ENABLED'):
+        return
+    stale_seconds = app.config.setdefault('IMPORT_STALE_SECONDS', 300)
+    started = {'pid': None}
+    lock = threading.Lock()
+
+    def watch():
+        while True:
+            time.sleep(max(1, stale_seconds / 5))
+            with app.app_context():
+                try:
+                    for job_id in claim_stale_jobs(stale_seconds):
+                        app.logger.warning('Resuming stalled import job %s', job_id)
+                        start_import(app, job_id, on_finish)
+                except Exception:
+                    app.logger.exception('Import watchdog failed')
+
+    @app.before_request
+    def start_watchdog():
+        if started['pid'] != os.getpid():
+            with lock:
+                if started['pid'] != os.getpid():
+                    started['pid'] = os.getpid()
+                    threading.Thread(target=watch, name='import-watchdog', daemon=True).start()
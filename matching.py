@@ -0,0 +1,353 @@
+import math
+import multiprocessing
+import os
+import statistics
+import time
+from array import array
+from collections import Counter, deque, namedtuple
+from datetime import datetime
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from models import db, User, Machine, Enquiry, SimilarityTerm, MachineTerm, MachineSimilarity, BuyerRecommendation
+from similarity import tokenize, tfidf_vector, posting_lists
+from specs import parse_amount, parse_capacity_per_shift
+
+# Buyer-to-machine matching.
+# A nightly batch (python init_db.py match) turns every buyer's recent
+# enquiries into a profile: the categories they asked about, their median
+# budget, the largest production need, their usual location and a TF-IDF
+# vector made of the enquired machines' terms plus the enquiry text. Each
+# profile is scored against the catalog and the TOP_N machines are written
+# to buyer_recommendations, which the buyer dashboard reads.
+#
+# Scoring every buyer against every machine is 10^12 pairs at full scale, so
+# each buyer is only scored against candidates drawn from the catalog's
+# indexes: neighbours of the machines they enquired about, the posting lists
+# of their profile terms and the newest machines of their top categories
+# (all capped, see below). Candidates are then ranked on WEIGHTS.
+#
+# The catalog is loaded once into NumPy arrays and shared with forked worker
+# processes. Buyers are scored in chunks of CHUNK_SIZE; every constant below
+# caps the candidates per buyer, so a worker's memory is bounded by the chunk
+# size no matter how large the catalog or a buyer's history grows. Text
+# similarity uses the vectors of the last similarity build (similarity.py);
+# without one, matching falls back to categories, price, capacity and location.
+
+TOP_N = 12
+
+WEIGHTS = {'category': 0.3, 'price': 0.25, 'capacity': 0.15, 'text': 0.2, 'location': 0.1}
+
+# Fit used when the budget, need or machine spec is unknown
+NEUTRAL_FIT = 0.5
+
+# Per-buyer candidate caps
+MAX_ENQUIRIES = 20
+PROFILE_TERMS = 10
+PROFILE_CATEGORIES = 3
+POSTING_CAP = 50
+CATEGORY_CAP = 100
+
+# Buyers per worker task; peak memory per worker grows linearly with it
+CHUNK_SIZE = 500
+BATCH_SIZE = 10_000
+
+Catalog = namedtuple('Catalog', [
+    'ids', 'category', 'price_min', 'capacity', 'city', 'city_codes', 'vocabulary', 'n_terms',
+    'term_indptr', 'terms', 'weights', 'neighbour_indptr', 'neighbours',
+    'post_rows', 'post_start', 'category_rows', 'category_start'])
+
+# Set in the parent before the worker pool forks
+_catalog = None
+
+def _ranges(starts, ends):
+    """Concatenate arange(start, end) over the given bounds"""
+    lengths = ends - starts
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+def _lookup(keys, values, query):
+    """Return values[i] where keys[i] == query (keys sorted), else 0"""
+    if not len(keys):
+        return np.zeros(len(query))
+    index = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return np.where(keys[index] == query, values[index], 0)
+
+def _rows(ids, machine_ids):
+    """Return the catalog rows of `machine_ids`, -1 for machines not in the catalog"""
+    rows = np.minimum(np.searchsorted(ids, machine_ids), len(ids) - 1)
+    return np.where(ids[rows] == machine_ids, rows, -1)
+
+def _city_key(location):
+    """Normalise 'Pune, Maharashtra' and 'pune' alike"""
+    return location.split(',')[0].strip().lower()
+
+def _load_csr(statement, ids):
+    """Stream (machine_id, column, value) rows in machine_id order into CSR arrays over catalog rows"""
+    owners = array('i')
+    columns = array('i')
+    values = array('f')
+    with db.engine.connect() as conn:
+        for owner, column, value in conn.execution_options(yield_per=BATCH_SIZE).execute(statement):
+            owners.append(owner)
+            columns.append(column)
+            values.append(value)
+    rows = _rows(ids, np.frombuffer(owners, dtype=np.int32))
+    known = rows >= 0
+    indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(rows[known], minlength=len(ids)))
+    return (indptr, np.frombuffer(columns, dtype=np.int32)[known],
+            np.frombuffer(values, dtype=np.float32)[known])
+
+def _load_catalog():
+    """Load the matching features of every machine, or None for an empty catalog"""
+    ids = array('i')
+    categories = array('i')
+    cities = array('i')
+    price_min = array('d')
+    capacity = array('d')
+    category_codes, city_codes = {}, {}
+    statement = select(Machine.id, Machine.category, Machine.price_min, Machine.capacity_per_shift, User.city) \
+        .join(User, User.id == Machine.supplier_id) \
+        .order_by(Machine.id)
+    with db.engine.connect() as conn:
+        for machine_id, category, price, machine_capacity, city in \
+                conn.execution_options(yield_per=BATCH_SIZE).execute(statement):
+            ids.append(machine_id)
+            categories.append(category_codes.setdefault(category, len(category_codes)))
+            price_min.append(math.nan if price is None else price)
+            capacity.append(math.nan if machine_capacity is None else machine_capacity)
+            cities.append(city_codes.setdefault(_city_key(city), len(city_codes)) if city else -1)
+    if not ids:
+        return None
+    ids = np.frombuffer(ids, dtype=np.int32)
+    category = np.frombuffer(categories, dtype=np.int32)
+
+    vocabulary = {term: (term_id, idf) for term_id, term, idf in db.session.execute(
+        select(SimilarityTerm.id, SimilarityTerm.term, SimilarityTerm.idf))}
+    term_indptr, terms, weights = _load_csr(
+        select(MachineTerm.machine_id, MachineTerm.term_id, MachineTerm.weight).order_by(MachineTerm.machine_id),
+        ids)
+    neighbour_indptr, similar_ids, _ = _load_csr(
+        select(MachineSimilarity.machine_id, MachineSimilarity.similar_id, MachineSimilarity.score)
+        .order_by(MachineSimilarity.machine_id), ids)
+    post_rows, _, post_start = posting_lists(term_indptr, terms, weights, POSTING_CAP)
+    # Newest machines first: weigh each row by its position in id order
+    category_rows, _, category_start = posting_lists(
+        np.arange(len(ids) + 1), category, np.arange(len(ids), dtype=np.float64), CATEGORY_CAP)
+    return Catalog(
+        ids=ids, category=category,
+        price_min=np.frombuffer(price_min, dtype=np.float64),
+        capacity=np.frombuffer(capacity, dtype=np.float64),
+        city=np.frombuffer(cities, dtype=np.int32), city_codes=city_codes,
+        vocabulary=vocabulary, n_terms=max((term_id for term_id, _ in vocabulary.values()), default=0) + 1,
+        term_indptr=term_indptr, terms=terms, weights=weights,
+        neighbour_indptr=neighbour_indptr, neighbours=_rows(ids, similar_ids),
+        post_rows=post_rows, post_start=post_start,
+        category_rows=category_rows, category_start=category_start)
+
+def _buyer_chunks(chunk_size):
+    """Yield lists of (buyer_id, enquiries) in buyer id order
+
+    `enquiries` are the buyer's latest MAX_ENQUIRIES enquiries as
+    (machine_id, budget, location, production_need, message) tuples. Each
+    chunk is read with its own short query, so no cursor stays open while
+    results are written.
+    """
+    last_id = 0
+    while True:
+        buyer_ids = db.session.execute(
+            select(Enquiry.buyer_id).where(Enquiry.buyer_id > last_id).distinct()
+            .order_by(Enquiry.buyer_id).limit(chunk_size)).scalars().all()
+        if not buyer_ids:
+            return
+        # Cut each history down in SQL, so that memory does not grow with it
+        latest = select(Enquiry.buyer_id, Enquiry.machine_id, Enquiry.budget, Enquiry.location,
+                        Enquiry.production_need, Enquiry.message, Enquiry.created_at, Enquiry.id,
+                        func.row_number().over(partition_by=Enquiry.buyer_id,
+                                               order_by=(Enquiry.created_at.desc(), Enquiry.id.desc()))
+                        .label('position')) \
+            .where(Enquiry.buyer_id.between(buyer_ids[0], buyer_ids[-1])).subquery()
+        rows = db.session.execute(
+            select(latest.c.buyer_id, latest.c.machine_id, latest.c.budget, latest.c.location,
+                   latest.c.production_need, latest.c.message)
+            .where(latest.c.position <= MAX_ENQUIRIES)
+            .order_by(latest.c.buyer_id, latest.c.created_at, latest.c.id)).all()
+        db.session.rollback()
+        enquiries = {}
+        for buyer_id, *enquiry in rows:
+            enquiries.setdefault(buyer_id, []).append(tuple(enquiry))
+        yield list(enquiries.items())
+        last_id = buyer_ids[-1]
+
+def _profile_terms(catalog, rows, enquiries):
+    """Return a buyer's heaviest (term_id, weight) pairs, L2-normalised
+
+    Averages the vectors of the enquired machines and adds the TF-IDF vector
+    of the buyer's own enquiry text.
+    """
+    profile = Counter()
+    if len(rows):
+        entries = _ranges(catalog.term_indptr[rows], catalog.term_indptr[rows + 1])
+        for term_id, weight in zip(catalog.terms[entries].tolist(), catalog.weights[entries].tolist()):
+            profile[term_id] += weight / len(rows)
+    text = ' '.join(' '.join(filter(None, (need, message))) for _, _, _, need, message in enquiries)
+    for term_id, weight in tfidf_vector(tokenize(text), catalog.vocabulary):
+        profile[term_id] += weight
+    top = profile.most_common(PROFILE_TERMS)
+    norm = math.sqrt(sum(weight * weight for _, weight in top))
+    return [(term_id, weight / norm) for term_id, weight in top] if norm else []
+
+def _score_chunk(buyers):
+    """Return the top recommendations of a chunk of buyers as (buyer_ids, machine_ids, scores) arrays"""
+    catalog = _catalog
+    n = len(catalog.ids)
+    n_buyers = len(buyers)
+    n_categories = len(catalog.category_start)
+    budgets = np.full(n_buyers, np.nan)
+    needs = np.full(n_buyers, np.nan)
+    cities = np.full(n_buyers, -1, dtype=np.int32)
+    term_keys, term_weights = [], []
+    category_keys, category_shares = [], []
+    candidate_keys, enquired_keys = [], []
+
+    for b, (_, enquiries) in enumerate(buyers):
+        rows = _rows(catalog.ids, np.array([enquiry[0] for enquiry in enquiries], dtype=np.int32))
+        rows = rows[rows >= 0]
+        amounts = [amount for amount in (parse_amount(enquiry[1]) for enquiry in enquiries) if amount]
+        if amounts:
+            budgets[b] = statistics.median(amounts)
+        capacities = [need for need in (parse_capacity_per_shift(enquiry[3]) for enquiry in enquiries) if need]
+        if capacities:
+            needs[b] = max(capacities)
+        locations = Counter(_city_key(enquiry[2]) for enquiry in enquiries if enquiry[2])
+        if locations:
+            cities[b] = catalog.city_codes.get(locations.most_common(1)[0][0], -1)
+
+        profile = _profile_terms(catalog, rows, enquiries)
+        for term_id, weight in profile:
+            term_keys.append(b * catalog.n_terms + term_id)
+            term_weights.append(weight)
+        category_counts = Counter(catalog.category[rows].tolist())
+        for category, count in category_counts.items():
+            category_keys.append(b * n_categories + category)
+            category_shares.append(count / len(rows))
+
+        # Candidates: neighbours of enquired machines, term postings, newest in top categories
+        posted = np.array([term_id for term_id, _ in profile if term_id < len(catalog.post_start) - 1],
+                          dtype=np.int64)
+        top_categories = np.array([category for category, _ in category_counts.most_common(PROFILE_CATEGORIES)],
+                                  dtype=np.int64)
+        candidates = np.concatenate([
+            catalog.neighbours[_ranges(catalog.neighbour_indptr[rows], catalog.neighbour_indptr[rows + 1])],
+            catalog.post_rows[_ranges(catalog.post_start[posted], catalog.post_start[posted + 1])],
+            catalog.category_rows[_ranges(catalog.category_start[top_categories],
+                                          catalog.category_start[top_categories + 1])],
+        ])
+        candidate_keys.append(b * n + candidates[candidates >= 0].astype(np.int64))
+        enquired_keys.append(b * n + rows.astype(np.int64))
+
+    keys = np.unique(np.concatenate(candidate_keys)) if candidate_keys else np.zeros(0, dtype=np.int64)
+    keys = keys[~np.isin(keys, np.concatenate(enquired_keys))]
+    if not len(keys):
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+    pair_buyers = keys // n
+    pair_rows = keys % n
+
+    # Cosine similarity: both sides are unit vectors over the same terms
+    order = np.argsort(term_keys)
+    term_keys = np.array(term_keys, dtype=np.int64)[order]
+    term_weights = np.array(term_weights)[order]
+    lengths = catalog.term_indptr[pair_rows + 1] - catalog.term_indptr[pair_rows]
+    entries = _ranges(catalog.term_indptr[pair_rows], catalog.term_indptr[pair_rows + 1])
+    pair_of_entry = np.repeat(np.arange(len(keys)), lengths)
+    buyer_weights = _lookup(term_keys, term_weights,
+                            pair_buyers[pair_of_entry] * catalog.n_terms + catalog.terms[entries])
+    text = np.bincount(pair_of_entry, weights=buyer_weights * catalog.weights[entries], minlength=len(keys))
+
+    order = np.argsort(category_keys)
+    category = _lookup(np.array(category_keys, dtype=np.int64)[order], np.array(category_shares)[order],
+                       pair_buyers * n_categories + catalog.category[pair_rows])
+
+    budget = budgets[pair_buyers]
+    price = catalog.price_min[pair_rows]
+    price_fit = np.where(np.isnan(budget) | np.isnan(price), NEUTRAL_FIT,
+                         np.clip(budget / np.maximum(price, 1), 0, 1) ** 2)
+    need = needs[pair_buyers]
+    capacity = catalog.capacity[pair_rows]
+    capacity_fit = np.where(np.isnan(need) | np.isnan(capacity), NEUTRAL_FIT,
+                            np.clip(capacity / np.maximum(need, 1), 0, 1))
+    location = (cities[pair_buyers] >= 0) & (cities[pair_buyers] == catalog.city[pair_rows])
+
+    scores = (WEIGHTS['category'] * category + WEIGHTS['price'] * price_fit
+              + WEIGHTS['capacity'] * capacity_fit + WEIGHTS['text'] * text
+              + WEIGHTS['location'] * location)
+
+    # Keep each buyer's TOP_N
+    best = np.lexsort((-scores, pair_buyers))
+    pair_buyers, pair_rows, scores = pair_buyers[best], pair_rows[best], scores[best]
+    top = np.arange(len(pair_buyers)) - np.searchsorted(pair_buyers, pair_buyers) < TOP_N
+    buyer_ids = np.array([buyer_id for buyer_id, _ in buyers], dtype=np.int32)
+    return buyer_ids[pair_buyers[top]], catalog.ids[pair_rows[top]], scores[top].astype(np.float32)
+
+def _write_chunk(first_id, last_id, result, computed_at):
+    """Replace the recommendations of buyers first_id..last_id; returns the rows written"""
+    buyer_ids, machine_ids, scores = result
+    table = BuyerRecommendation.__table__
+    with db.engine.begin() as conn:
+        conn.execute(delete(table).where(table.c.buyer_id.between(first_id, last_id)))
+        if len(buyer_ids):
+            conn.execute(insert(table), [
+                {'buyer_id': buyer_id, 'machine_id': machine_id, 'score': score, 'computed_at': computed_at}
+                for buyer_id, machine_id, score in zip(buyer_ids.tolist(), machine_ids.tolist(), scores.tolist())])
+    return len(buyer_ids)
+
+def build_recommendations(workers=None, chunk_size=CHUNK_SIZE):
+    """Recompute the recommendations of every buyer with enquiries
+
+    Chunks are scored by `workers` processes (default: one per core, 1 scores
+    in this process) with at most two chunks per worker in flight. Returns a
+    dict of build statistics.
+    """
+    global _catalog
+    started = time.perf_counter()
+    computed_at = datetime.utcnow()
+    workers = workers or os.cpu_count() or 1
+    _catalog = _load_catalog()
+    loaded = time.perf_counter()
+    buyers = links = 0
+    try:
+        if _catalog is not None:
+            if workers > 1:
+                # Forked workers must not inherit pooled connections
+                db.session.remove()
+                db.engine.dispose()
+                with multiprocessing.get_context('fork').Pool(workers) as pool:
+                    pending = deque()
+                    for chunk in _buyer_chunks(chunk_size):
+                        pending.append((chunk[0][0], chunk[-1][0], pool.apply_async(_score_chunk, (chunk,))))
+                        buyers += len(chunk)
+                        while len(pending) >= 2 * workers:
+                            first_id, last_id, result = pending.popleft()
+                            links += _write_chunk(first_id, last_id, result.get(), computed_at)
+                    while pending:
+                        first_id, last_id, result = pending.popleft()
+                        links += _write_chunk(first_id, last_id, result.get(), computed_at)
+            else:
+                for chunk in _buyer_chunks(chunk_size):
+                    links += _write_chunk(chunk[0][0], chunk[-1][0], _score_chunk(chunk), computed_at)
+                    buyers += len(chunk)
+    finally:
+        _catalog = None
+
+    # Buyers left without enquiries keep nothing from earlier runs
+    table = BuyerRecommendation.__table__
+    with db.engine.begin() as conn:
+        conn.execute(delete(table).where(table.c.computed_at < computed_at))
+    finished = time.perf_counter()
+    return {
+        'buyers': buyers,
+        'links': links,
+        'workers': workers,
+        'load_seconds': round(loaded - started, 2),
+        'score_seconds': round(finished - loaded, 2),
+        'total_seconds': round(finished - started, 2),
+    }
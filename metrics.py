@@ -0,0 +1,104 @@
+import os
+import time
+from flask import Response, abort, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess, REGISTRY)
+from sqlalchemy import event
+from models import db
+
+# Prometheus metrics served at /metrics.
+# Under gunicorn, PROMETHEUS_MULTIPROC_DIR points at an empty directory before
+# the workers start (gunicorn.conf.py defaults it to <tmp>/b2b-metrics and
+# empties it): each worker then writes its samples to memory-mapped files
+# there and /metrics aggregates all of them, whichever worker answers.
+# gunicorn.conf.py removes a worker's live files when it exits.
+
+REQUEST_COUNT = Counter(
+    'http_requests_total', 'HTTP requests handled',
+    ['endpoint', 'method', 'status'])
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request',
+    ['endpoint'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0))
+
+POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled database connection',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0))
+
+UPLOAD_BYTES = Counter(
+    'upload_bytes_received_total', 'Bytes received in multipart upload requests',
+    ['endpoint'])
+
+PAGE_CACHE_REQUESTS = Counter(
+    'page_cache_requests_total', 'Fragment cache lookups by result',
+    ['fragment', 'result'])
+
+IMAGE_PROXY_REQUESTS = Counter(
+    'image_proxy_requests_total', 'Image proxy requests by result (hit, miss or error)',
+    ['size', 'result'])
+
+def init_metrics(app):
+    """Record request metrics for `app` and register the /metrics endpoint"""
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_pool(engine)
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+def instrument_pool(engine):
+    """Time how long each connection checkout waits on the engine's pool
+
+    engine.dispose() swaps in a new pool (gunicorn's post_fork does this in
+    every worker), so the new pool is wrapped again when that happens.
+    """
+    if not event.contains(engine, 'engine_disposed', instrument_pool):
+        event.listen(engine, 'engine_disposed', instrument_pool)
+    pool = engine.pool
+    if getattr(pool, '_checkout_timed', False):
+        return
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+    pool._checkout_timed = True
+
+def _endpoint_label():
+    return request.endpoint or 'unmatched'
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+def _record_request(response):
+    start = g.pop('metrics_start', None)
+    endpoint = _endpoint_label()
+    if endpoint == 'metrics':
+        return response
+    if start is not None:
+        REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+    REQUEST_COUNT.labels(endpoint, request.method, str(response.status_code)).inc()
+    if request.mimetype == 'multipart/form-data' and request.content_length:
+        UPLOAD_BYTES.labels(endpoint).inc(request.content_length)
+    return response
+
+def metrics_view():
+    """Prometheus text exposition of the collected metrics"""
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(403)
+
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,115 @@
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, text
+from models import db, ArchivedEnquiry
+from search import init_search
+from specs import backfill_specs
+from rollups import rebuild_rollups
+
+# Versioned schema migrations.
+# db.create_all() only creates missing tables, so changes to existing tables
+# are listed here and applied in order by migrate(). Each migration is a
+# (version, description, steps) tuple; a step is either a SQL string or a
+# callable taking the connection. Steps must be idempotent because a fresh
+# database already has the latest schema from create_all().
+
+def column_exists(conn, table, column):
+    """Return True if `table` already has `column`"""
+    return column in [col['name'] for col in inspect(conn).get_columns(table)]
+
+def _add_user_version(conn):
+    if not column_exists(conn, 'users', 'version'):
+        conn.execute(text("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+def _add_machine_specs(conn):
+    for column, column_type in [('price_min', 'BIGINT'), ('price_max', 'BIGINT'),
+                                ('power_kw', 'FLOAT'), ('capacity_per_shift', 'INTEGER')]:
+        if not column_exists(conn, 'machines', column):
+            conn.execute(text(f"ALTER TABLE machines ADD COLUMN {column} {column_type}"))
+
+def _create_enquiry_archive(conn):
+    ArchivedEnquiry.__table__.create(conn, checkfirst=True)
+
+MIGRATIONS = [
+    (1, 'Secondary indexes on foreign keys and sort columns', [
+        "CREATE INDEX IF NOT EXISTS ix_machines_supplier_id ON machines (supplier_id)",
+        "CREATE INDEX IF NOT EXISTS ix_machines_created_at_id ON machines (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_machines_category_created_at ON machines (category, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_enquiries_status ON enquiries (status)",
+        "CREATE INDEX IF NOT EXISTS ix_enquiries_machine_id_created_at ON enquiries (machine_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_enquiries_buyer_id_created_at ON enquiries (buyer_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_enquiries_created_at_id ON enquiries (created_at, id)",
+    ]),
+    (2, 'Profile version stamp on users', [_add_user_version]),
+    (3, 'Numeric price, power and capacity columns on machines', [
+        _add_machine_specs,
+        "CREATE INDEX IF NOT EXISTS ix_machines_price_min_id ON machines (price_min, id)",
+        "CREATE INDEX IF NOT EXISTS ix_machines_price_max_id ON machines (price_max, id)",
+        "CREATE INDEX IF NOT EXISTS ix_machines_power_kw_id ON machines (power_kw, id)",
+        "CREATE INDEX IF NOT EXISTS ix_machines_capacity_per_shift_id ON machines (capacity_per_shift, id)",
+        backfill_specs,
+    ]),
+    (4, 'Daily rollup counters for the admin dashboard', [rebuild_rollups]),
+    (5, 'Index on users.profile_image for image reference checks', [
+        "CREATE INDEX IF NOT EXISTS ix_users_profile_image ON users (profile_image)",
+    ]),
+    (6, 'Index on machines.updated_at for API ETags', [
+        "CREATE INDEX IF NOT EXISTS ix_machines_updated_at ON machines (updated_at)",
+    ]),
+    (7, 'Archive table for old closed enquiries', [_create_enquiry_archive]),
+    (8, 'Index for paging a supplier\'s machines on the dashboard', [
+        "CREATE INDEX IF NOT EXISTS ix_machines_supplier_id_created_at ON machines (supplier_id, created_at, id)",
+    ]),
+]
+
+migration_log = logging.getLogger('migrations')
+
+def _ensure_version_table(conn):
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description VARCHAR(200) NOT NULL,
+        applied_at TIMESTAMP NOT NULL)"""))
+
+def current_version():
+    """Return the highest applied migration version (0 if none)"""
+    with db.engine.begin() as conn:
+        _ensure_version_table(conn)
+        return conn.execute(text("SELECT MAX(version) FROM schema_migrations")).scalar() or 0
+
+def migrate():
+    """Apply all pending migrations, each in its own transaction
+
+    Returns the list of versions that were applied.
+    """
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        with db.engine.begin() as conn:
+            if db.engine.dialect.name == 'postgresql':
+                # Serialize concurrent workers booting at the same time
+                conn.execute(text("SELECT pg_advisory_xact_lock(727401)"))
+            _ensure_version_table(conn)
+            done = conn.execute(text("SELECT 1 FROM schema_migrations WHERE version = :v"),
+                                {'v': version}).first()
+            if done:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            conn.execute(text("INSERT INTO schema_migrations (version, description, applied_at) "
+                              "VALUES (:v, :d, :t)"),
+                         {'v': version, 'd': description, 't': datetime.utcnow()})
+            applied.append(version)
+            migration_log.info("Applied migration %s: %s", version, description)
+    return applied
+
+def ensure_schema():
+    """Create missing tables, apply pending migrations and set up search
+
+    Returns the list of migration versions that were applied.
+    """
+    db.create_all()
+    applied = migrate()
+    init_search()
+    return applied
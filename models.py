@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from replicas import RoutingSession
 
 # Initialize SQLAlchemy
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     """User model for authentication and roles"""
@@ -13,11 +14,12 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'buyer', 'supplier', 'admin'
-    profile_image = db.Column(db.String(255), nullable=True)  # Path to profile image
+    profile_image = db.Column(db.String(255), nullable=True, index=True)  # Content hash (see profile_images.py)
     company_name = db.Column(db.String(150), nullable=True)
     city = db.Column(db.String(100), nullable=True)
     industry = db.Column(db.String(100), nullable=True)
     phone = db.Column(db.String(20), nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # bumped on profile edits
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -32,7 +34,7 @@ class Machine(db.Model):
     __tablename__ = 'machines'
     
     id = db.Column(db.Integer, primary_key=True)
-    supplier_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     name = db.Column(db.String(200), nullable=False)
     category = db.Column(db.String(100), nullable=False)
     use_case = db.Column(db.String(200), nullable=False)
@@ -59,12 +61,30 @@ class Machine(db.Model):
     business_size_fit = db.Column(db.String(100))
     installation_support = db.Column(db.String(10))  # yes/no
     
+    # Numeric specs parsed from the text fields above (see specs.py)
+    price_min = db.Column(db.BigInteger)  # rupees
+    price_max = db.Column(db.BigInteger)
+    power_kw = db.Column(db.Float)
+    capacity_per_shift = db.Column(db.Integer)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     enquiries = db.relationship('Enquiry', backref='machine', lazy=True)
     
+    # Indexes for catalog ordering, filtering and sorting (see migrations.py)
+    __table_args__ = (
+        db.Index('ix_machines_created_at_id', 'created_at', 'id'),
+        db.Index('ix_machines_category_created_at', 'category', 'created_at', 'id'),
+        db.Index('ix_machines_supplier_id_created_at', 'supplier_id', 'created_at', 'id'),
+        db.Index('ix_machines_price_min_id', 'price_min', 'id'),
+        db.Index('ix_machines_price_max_id', 'price_max', 'id'),
+        db.Index('ix_machines_power_kw_id', 'power_kw', 'id'),
+        db.Index('ix_machines_capacity_per_shift_id', 'capacity_per_shift', 'id'),
+        db.Index('ix_machines_updated_at', 'updated_at'),
+    )
+    
     def __repr__(self):
         return f'<Machine {self.name}>'
     
@@ -98,8 +118,138 @@ class Enquiry(db.Model):
     budget = db.Column(db.String(100), nullable=False)
     location = db.Column(db.String(200), nullable=False)
     production_need = db.Column(db.String(300), nullable=False)
-    status = db.Column(db.String(20), default='pending')  # 'pending', 'responded', 'closed'
+    status = db.Column(db.String(20), default='pending', index=True)  # 'pending', 'responded', 'closed'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Indexes for inbox queries (see migrations.py)
+    __table_args__ = (
+        db.Index('ix_enquiries_machine_id_created_at', 'machine_id', 'created_at'),
+        db.Index('ix_enquiries_buyer_id_created_at', 'buyer_id', 'created_at'),
+        db.Index('ix_enquiries_created_at_id', 'created_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Enquiry for Machine {self.machine_id} by Buyer {self.buyer_id}>'
+
+class ArchivedEnquiry(db.Model):
+    """Closed enquiry moved out of the enquiries table (see archive.py)"""
+    __tablename__ = 'enquiries_archive'
+    
+    # Same columns as Enquiry, so both can be read as one (archive.EnquiryHistory)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    machine_id = db.Column(db.Integer, db.ForeignKey('machines.id'), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    budget = db.Column(db.String(100), nullable=False)
+    location = db.Column(db.String(200), nullable=False)
+    production_need = db.Column(db.String(300), nullable=False)
+    status = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_enquiries_archive_machine_id_created_at', 'machine_id', 'created_at'),
+        db.Index('ix_enquiries_archive_buyer_id_created_at', 'buyer_id', 'created_at'),
+        db.Index('ix_enquiries_archive_created_at_id', 'created_at', 'id'),
+    )
+
+class SimilarityTerm(db.Model):
+    """Vocabulary of the similar-machines index (see similarity.py)"""
+    __tablename__ = 'similarity_terms'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(100), unique=True, nullable=False)
+    idf = db.Column(db.Float, nullable=False)
+
+class MachineTerm(db.Model):
+    """One entry of a machine's sparse TF-IDF vector"""
+    __tablename__ = 'machine_terms'
+    
+    machine_id = db.Column(db.Integer, db.ForeignKey('machines.id'), primary_key=True)
+    term_id = db.Column(db.Integer, db.ForeignKey('similarity_terms.id'), primary_key=True)
+    weight = db.Column(db.Float, nullable=False)
+    
+    # Posting lists: the machines using a term, heaviest first
+    __table_args__ = (
+        db.Index('ix_machine_terms_term_id_weight', 'term_id', 'weight'),
+    )
+
+class MachineSimilarity(db.Model):
+    """Precomputed nearest neighbour of a machine"""
+    __tablename__ = 'machine_similarities'
+    
+    machine_id = db.Column(db.Integer, db.ForeignKey('machines.id'), primary_key=True)
+    similar_id = db.Column(db.Integer, db.ForeignKey('machines.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_machine_similarities_machine_id_score', 'machine_id', 'score'),
+    )
+
+class BuyerRecommendation(db.Model):
+    """Precomputed machine recommendation for a buyer (see matching.py)"""
+    __tablename__ = 'buyer_recommendations'
+    
+    buyer_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    machine_id = db.Column(db.Integer, db.ForeignKey('machines.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_buyer_recommendations_buyer_id_score', 'buyer_id', 'score'),
+    )
+
+class DailyRollup(db.Model):
+    """Count of new rows per day for one metric and key (see rollups.py)"""
+    __tablename__ = 'daily_rollups'
+    
+    metric = db.Column(db.String(30), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Trend charts read a date range across all keys of a metric
+    __table_args__ = (
+        db.Index('ix_daily_rollups_metric_day', 'metric', 'day'),
+    )
+
+class RollupTotal(db.Model):
+    """All-time count for one metric and key (see rollups.py)"""
+    __tablename__ = 'rollup_totals'
+    
+    metric = db.Column(db.String(30), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class ImportJob(db.Model):
+    """Bulk machine import from an uploaded file (see machine_import.py)"""
+    __tablename__ = 'import_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)  # as uploaded
+    path = db.Column(db.String(500), nullable=False)  # stored copy
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    total_rows = db.Column(db.Integer)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.String(500))  # why the whole file failed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ImportJob {self.id} ({self.status})>'
+
+class ImportRowError(db.Model):
+    """A row of an import file that was rejected"""
+    __tablename__ = 'import_row_errors'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('import_jobs.id'), nullable=False)
+    row_number = db.Column(db.Integer, nullable=False)
+    message = db.Column(db.String(500), nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_import_row_errors_job_id_row_number', 'job_id', 'row_number'),
+    )
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from cache import TTLCache
+from metrics import PAGE_CACHE_REQUESTS
+from models import db
+from replicas import primary_reads
+
+# Rendered fragment cache for the most-read pages.
+# Only the page body is cached; the surrounding layout (navigation, flash
+# messages) is rendered per request. Keys are built from the fragment name
+# and whatever the fragment depends on (machine id, updated_at, viewer
+# role) plus a generation number: invalidate() bumps the generation, which
+# orphans every existing entry at once.
+#
+# A miss renders from the primary database even in views that read from a
+# replica (replicas.py): a lagging replica would otherwise store a page
+# missing the write that just bumped the generation, for the whole TTL.
+#
+# Backends:
+#   memory - per-process LRU (default)
+#   file   - one file per entry in PAGE_CACHE_DIR, shared by every worker
+#            on the host; point it at /dev/shm to keep it in memory
+#   none   - caching disabled
+#
+# Both keep the generation in a file in PAGE_CACHE_DIR, so an invalidate()
+# in one gunicorn worker reaches the others on their next lookup.
+
+class GenerationFile:
+    """Generation number shared by all worker processes on a host"""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'generation')
+
+    def get(self):
+        try:
+            with open(self.path) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self):
+        # A fresh random-ish value avoids a read-modify-write race between workers
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp_path, self.path)
+
+class MemoryBackend:
+    """Per-process LRU backend"""
+
+    def __init__(self, directory, ttl, max_entries):
+        self._cache = TTLCache(ttl=ttl, max_entries=max_entries)
+        self._generation = GenerationFile(directory)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def generation(self):
+        return self._generation.get()
+
+    def bump_generation(self):
+        self._generation.bump()
+        self._cache.clear()
+
+class FileBackend:
+    """Directory-backed LRU shared by all worker processes on a host"""
+
+    PRUNE_EVERY = 100  # writes between size checks
+
+    def __init__(self, directory, ttl, max_entries):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._writes = 0
+        self._generation = GenerationFile(directory)
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f'{digest}.entry')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires < time.time():
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((time.time() + self.ttl, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Delete expired entries, then the least recently used beyond max_entries"""
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.entry'):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if mtime + self.ttl < now:
+                self._remove(entry.path)
+            else:
+                entries.append((mtime, entry.path))
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def generation(self):
+        return self._generation.get()
+
+    def bump_generation(self):
+        self._generation.bump()
+
+class PageCache:
+    """Fragment cache configured from the Flask app config"""
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.setdefault('PAGE_CACHE_BACKEND', 'memory')
+        ttl = int(app.config.setdefault('PAGE_CACHE_TTL', 300))
+        max_entries = int(app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', 2048))
+        directory = app.config.get('PAGE_CACHE_DIR') or os.path.join(app.instance_path, 'page_cache')
+        if backend == 'file':
+            self.backend = FileBackend(directory, ttl, max_entries)
+        elif backend == 'memory':
+            self.backend = MemoryBackend(directory, ttl, max_entries)
+        else:
+            self.backend = None
+
+    def fragment(self, name, key_parts, render):
+        """Return the cached fragment for (name, key_parts), rendering it on a miss"""
+        if self.backend is None:
+            return render()
+        key = (name, self.backend.generation()) + tuple(key_parts)
+        content = self.backend.get(key)
+        if content is not None:
+            PAGE_CACHE_REQUESTS.labels(name, 'hit').inc()
+            return content
+        PAGE_CACHE_REQUESTS.labels(name, 'miss').inc()
+        with primary_reads(db.session):
+            content = render()
+        self.backend.set(key, content)
+        return content
+
+    def invalidate(self):
+        """Drop every cached fragment (after a machine or enquiry is created)"""
+        if self.backend is not None:
+            self.backend.bump_generation()
+
+page_cache = PageCache()
@@ -0,0 +1,167 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, func, or_, select
+from models import db
+
+# Keyset (cursor) pagination.
+# A page is located by the sort key of the row at its edge instead of an
+# OFFSET, so fetching page N costs the same as fetching page 1.
+# Sort keys are lists of (expression, descending) pairs and must end in a
+# unique column (the primary key) so every row has a distinct position.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+class KeysetPage:
+    """One page of results plus the cursors of its neighbouring pages"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if set(value) != {'dt'} or not isinstance(value['dt'], str):
+            raise ValueError('not a datetime')
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+def _fits(expr, value):
+    """Return True if a decoded cursor value can be compared with `expr`"""
+    try:
+        python_type = expr.type.python_type
+    except NotImplementedError:
+        python_type = object
+    if python_type is object:
+        # Untyped expressions such as search ranks
+        python_type = float
+    if python_type is datetime:
+        return isinstance(value, datetime)
+    if python_type in (int, float):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if python_type is str:
+        return isinstance(value, str)
+    return False
+
+def encode_cursor(values):
+    """Encode a row's sort key values as an opaque URL-safe cursor"""
+    payload = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort_keys):
+    """Decode a cursor for `sort_keys`, returning None if it is malformed
+
+    Every value must have the type its sort key compares against, so a
+    crafted cursor never reaches the database.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(sort_keys):
+        return None
+    try:
+        values = [_decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        return None
+    if not all(_fits(expr, value) for (expr, _), value in zip(sort_keys, values)):
+        return None
+    return values
+
+def _beyond(sort_keys, values, forward):
+    """Build the WHERE clause selecting rows after `values` in sort order"""
+    clauses = []
+    for i, (expr, descending) in enumerate(sort_keys):
+        later = (expr < values[i]) if descending == forward else (expr > values[i])
+        equal_prefix = [sort_keys[j][0] == values[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, later))
+    return or_(*clauses)
+
+def _ordering(sort_keys, forward):
+    return [expr.desc() if descending == forward else expr.asc()
+            for expr, descending in sort_keys]
+
+def get_page_size(requested, default=DEFAULT_PAGE_SIZE):
+    """Clamp a user-supplied page size to a sane range"""
+    try:
+        size = int(requested)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+def paginate(query, sort_keys, per_page, after=None, before=None):
+    """Return the KeysetPage following `after` or preceding `before`
+
+    Without either cursor the first page is returned. Malformed cursors are
+    treated as absent.
+    """
+    forward = True
+    values = None
+    if before:
+        values = decode_cursor(before, sort_keys)
+        forward = values is None
+    elif after:
+        values = decode_cursor(after, sort_keys)
+
+    keyed = query.add_columns(*[expr for expr, _ in sort_keys])
+    if values is not None:
+        keyed = keyed.filter(_beyond(sort_keys, values, forward))
+    rows = keyed.order_by(*_ordering(sort_keys, forward)).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    first_key = encode_cursor(rows[0][1:]) if rows else None
+    last_key = encode_cursor(rows[-1][1:]) if rows else None
+
+    if forward:
+        next_cursor = last_key if has_more else None
+        prev_cursor = first_key if values is not None else None
+    else:
+        next_cursor = last_key
+        prev_cursor = first_key if has_more else None
+    return KeysetPage(items, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+def estimate_count(query, cap=1000):
+    """Cheaply estimate how many rows a query returns
+
+    Returns (count, exact). PostgreSQL answers from the planner's row
+    estimate; other backends count at most `cap` rows, so the cost is
+    bounded no matter how large the table is.
+    """
+    statement = query.order_by(None).statement
+    if db.engine.dialect.name == 'postgresql':
+        compiled = statement.compile(dialect=db.engine.dialect)
+        plan = db.session.connection().exec_driver_sql(
+            f'EXPLAIN (FORMAT JSON) {compiled}', compiled.params).scalar()
+        return int(plan[0]['Plan']['Plan Rows']), False
+
+    limited = statement.limit(cap + 1).subquery()
+    count = db.session.execute(select(func.count()).select_from(limited)).scalar()
+    return min(count, cap), count <= cap
@@ -0,0 +1,236 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, url_for
+from PIL import Image, ImageOps
+from sqlalchemy import select, update
+from models import db, User
+
+# Profile image pipeline.
+# An upload is streamed to a temporary file in the image folder and hashed on
+# the way; the SHA-256 of its bytes names the image. A background thread pool
+# decodes it once and writes one square WebP per VARIANTS size as
+# <hash[:2]>/<hash>-<variant>.webp, then points the user at the hash.
+# Re-encoding drops EXIF and other metadata (the EXIF rotation is applied
+# first) and the original file is not kept. Templates ask avatar_url() for
+# the variant that fits where the avatar is shown.
+#
+# Identical uploads share one set of files: when the variants already exist
+# the upload is assigned at once and nothing is processed. When a user's
+# image changes, the old files are deleted if no user refers to them any
+# more. collect_garbage() (python init_db.py images) sweeps whatever that
+# missed, such as the output of a worker that died, and also converts the
+# static paths stored before this pipeline existed.
+
+# Variant sizes in pixels: 2x the nav bar avatar (32px) and the profile
+# pages (100-120px)
+VARIANTS = {'small': 64, 'medium': 256}
+
+IMAGE_URL_PREFIX = 'uploads/profile_images'
+CHUNK_BYTES = 64 * 1024
+MAX_PIXELS = 40_000_000
+WEBP_QUALITY = 80
+
+# Files younger than this may belong to an upload that is not assigned yet
+GRACE_SECONDS = 10 * 60
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def image_folder():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'profile_images')
+
+def _is_hash(value):
+    return '/' not in value
+
+def _variant_name(digest, variant):
+    return f'{digest[:2]}/{digest}-{variant}.webp'
+
+def _image_files(value):
+    """Paths on disk of a stored profile_image value"""
+    if not _is_hash(value):
+        # A static path from before the pipeline
+        return [os.path.join(current_app.static_folder, value)]
+    return [os.path.join(image_folder(), _variant_name(value, variant)) for variant in VARIANTS]
+
+def avatar_url(value, variant='small'):
+    """URL of a stored profile image at one of the VARIANTS sizes"""
+    if not value:
+        return None
+    if not _is_hash(value):
+        return url_for('static', filename=value)
+    return url_for('static', filename=f'{IMAGE_URL_PREFIX}/{_variant_name(value, variant)}')
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _check_image(path):
+    try:
+        with Image.open(path) as image:
+            if image.width * image.height > MAX_PIXELS:
+                raise ValueError('The image is too large, please upload a smaller one')
+            image.verify()
+    except ValueError:
+        raise
+    except Exception:
+        raise ValueError('The file is not an image that can be read')
+
+def receive_upload(upload):
+    """Stream an uploaded image to a temporary file, hashing it on the way
+
+    Returns (hash, path). Raises ValueError if the upload is larger than
+    PROFILE_IMAGE_MAX_MB or is not a readable image.
+    """
+    max_bytes = current_app.config['PROFILE_IMAGE_MAX_MB'] * 1024 * 1024
+    os.makedirs(image_folder(), exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix='.upload', dir=image_folder())
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: upload.stream.read(CHUNK_BYTES), b''):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Profile images can be at most {current_app.config['PROFILE_IMAGE_MAX_MB']} MB")
+                digest.update(chunk)
+                f.write(chunk)
+        _check_image(path)
+    except BaseException:
+        _remove(path)
+        raise
+    return digest.hexdigest(), path
+
+def reuse_variants(digest, path):
+    """Return True if the variants of `digest` already exist
+
+    The temporary upload at `path` is then no longer needed and is deleted,
+    and the variants are touched so the garbage sweep leaves them alone
+    until the upload is assigned.
+    """
+    files = _image_files(digest)
+    if not all(os.path.exists(file) for file in files):
+        return False
+    for file in files:
+        os.utime(file)
+    _remove(path)
+    return True
+
+def _write_variants(source, digest):
+    largest = max(VARIANTS.values())
+    os.makedirs(os.path.join(image_folder(), digest[:2]), exist_ok=True)
+    with Image.open(source) as image:
+        # JPEGs are decoded at the smallest scale that still covers the largest variant
+        image.draft('RGB', (largest, largest))
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if transparent else 'RGB')
+    for variant, size in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+        image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        path = os.path.join(image_folder(), _variant_name(digest, variant))
+        image.save(path + '.part', 'WEBP', quality=WEBP_QUALITY, method=4, icc_profile=icc_profile)
+        os.replace(path + '.part', path)
+
+def _assign(user_id, previous, digest):
+    """Point the user at `digest` unless their image changed since the upload"""
+    users = User.__table__
+    with db.engine.begin() as conn:
+        result = conn.execute(
+            update(users)
+            .where(users.c.id == user_id, users.c.profile_image.is_not_distinct_from(previous))
+            .values(profile_image=digest, version=users.c.version + 1))
+    return result.rowcount == 1
+
+def _in_use(value):
+    return db.session.execute(select(User.id).where(User.profile_image == value).limit(1)).first() is not None
+
+def release_image(value):
+    """Delete the files of a profile image that no user refers to any more"""
+    if not value or _in_use(value):
+        return
+    files = [file for file in _image_files(value) if os.path.exists(file)]
+    if _is_hash(value) and any(time.time() - os.path.getmtime(file) < GRACE_SECONDS for file in files):
+        return
+    for file in files:
+        _remove(file)
+
+def _process_upload(app, user_id, previous, digest, path):
+    with app.app_context():
+        try:
+            _write_variants(path, digest)
+        except Exception:
+            current_app.logger.exception('Processing profile image %s failed', digest)
+            return
+        finally:
+            _remove(path)
+        if _assign(user_id, previous, digest):
+            release_image(previous)
+
+def queue_variants(app, user_id, previous, digest, path):
+    """Build the variants of a received upload in the background
+
+    Once they are written the user's profile_image changes from `previous`
+    to `digest`, and their version is bumped so sessions reload it.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Created lazily so that each forked worker gets its own threads
+            _executor = ThreadPoolExecutor(max_workers=app.config['IMAGE_WORKERS'],
+                                           thread_name_prefix='profile-image')
+    return _executor.submit(_process_upload, app, user_id, previous, digest, path)
+
+def _convert_legacy(user_id, value):
+    source = os.path.join(current_app.static_folder, value)
+    if not os.path.exists(source):
+        return False
+    digest = hashlib.sha256()
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            digest.update(chunk)
+    digest = digest.hexdigest()
+    _write_variants(source, digest)
+    if _assign(user_id, value, digest):
+        release_image(value)
+    return True
+
+def collect_garbage():
+    """Convert old profile images and delete unreferenced files
+
+    Users whose profile_image is still a static path get it processed into
+    variants. Then every file in the image folder that no user refers to and
+    that is older than GRACE_SECONDS is deleted, including temporary uploads
+    left by interrupted requests. Returns counts of both.
+    """
+    stats = {'converted': 0, 'deleted': 0}
+    legacy = db.session.execute(
+        select(User.id, User.profile_image).where(User.profile_image.like('%/%'))).all()
+    db.session.rollback()
+    for user_id, value in legacy:
+        try:
+            if _convert_legacy(user_id, value):
+                stats['converted'] += 1
+        except Exception:
+            current_app.logger.exception('Converting profile image %s failed', value)
+
+    referenced = set()
+    for (value,) in db.session.execute(select(User.profile_image).where(User.profile_image.isnot(None)).distinct()):
+        referenced.update(os.path.abspath(file) for file in _image_files(value))
+    db.session.rollback()
+    cutoff = time.time() - GRACE_SECONDS
+    root = image_folder()
+    for directory, _, names in os.walk(root, topdown=False):
+        for name in names:
+            path = os.path.abspath(os.path.join(directory, name))
+            if path not in referenced and os.path.getmtime(path) < cutoff:
+                _remove(path)
+                stats['deleted'] += 1
+        if directory != root and not os.listdir(directory):
+            os.rmdir(directory)
+    return stats
@@ -0,0 +1,142 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import aliased, contains_eager, joinedload, load_only
+from models import db, User, Machine, Enquiry, MachineSimilarity, BuyerRecommendation
+from archive import enquiry_source
+
+# Query loaders for the dashboard and enquiry views.
+# Each loader fetches everything its template reads up front, so rendering
+# never falls back to per-row lazy loads. Loaders taking `history` include
+# archived enquiries when it is true (see archive.py).
+
+def enquiry_order(history=False):
+    """Inbox order, newest enquiries first"""
+    enquiry = enquiry_source(history)
+    return [(enquiry.created_at, True), (enquiry.id, True)]
+
+ENQUIRY_ORDER = enquiry_order()
+
+def supplier_enquiry_stats(supplier_id, history=False):
+    """Return ({machine_id: count}, {status: count}) for a supplier's enquiries"""
+    enquiry = enquiry_source(history)
+    rows = db.session.query(enquiry.machine_id, enquiry.status, func.count(enquiry.id)) \
+        .join(Machine, Machine.id == enquiry.machine_id) \
+        .filter(Machine.supplier_id == supplier_id) \
+        .group_by(enquiry.machine_id, enquiry.status) \
+        .all()
+    by_machine, by_status = {}, {}
+    for machine_id, status, count in rows:
+        by_machine[machine_id] = by_machine.get(machine_id, 0) + count
+        by_status[status] = by_status.get(status, 0) + count
+    return by_machine, by_status
+
+# A supplier's listings, newest first
+SUPPLIER_MACHINE_ORDER = [(Machine.created_at, True), (Machine.id, True)]
+
+def supplier_machines_query(supplier_id):
+    """Return an unordered query for a supplier's machines"""
+    return Machine.query.filter_by(supplier_id=supplier_id)
+
+def count_supplier_machines(supplier_id):
+    """Return how many machines a supplier lists"""
+    return db.session.query(func.count(Machine.id)).filter(Machine.supplier_id == supplier_id).scalar()
+
+def supplier_enquiries_query(supplier_id, history=False):
+    """Return an unordered query for enquiries on a supplier's machines,
+    with machine and buyer loaded alongside each row"""
+    enquiry = enquiry_source(history)
+    return db.session.query(enquiry) \
+        .join(Machine, Machine.id == enquiry.machine_id) \
+        .filter(Machine.supplier_id == supplier_id) \
+        .options(contains_eager(enquiry.machine), joinedload(enquiry.buyer))
+
+def load_buyer_enquiries(buyer_id):
+    """Return a buyer's enquiries with machine and machine supplier loaded"""
+    return Enquiry.query \
+        .filter_by(buyer_id=buyer_id) \
+        .options(joinedload(Enquiry.machine).joinedload(Machine.supplier)) \
+        .order_by(Enquiry.created_at.desc()) \
+        .all()
+
+def load_recent_enquiries(limit=10):
+    """Return the most recent enquiries platform-wide for the admin dashboard"""
+    return Enquiry.query \
+        .options(joinedload(Enquiry.machine).joinedload(Machine.supplier),
+                 joinedload(Enquiry.buyer)) \
+        .order_by(Enquiry.created_at.desc()) \
+        .limit(limit) \
+        .all()
+
+ENQUIRY_STATUSES = ['pending', 'responded', 'closed']
+
+MachineDetail = namedtuple('MachineDetail', ['machine', 'supplier', 'supplier_machines_count', 'enquiry_stats'])
+
+def load_machine_detail(machine_id, recent_days=30):
+    """Return a MachineDetail for the detail page in a single query, or None
+
+    enquiry_stats holds the machine's total enquiry count, the count from
+    the last `recent_days` days and a count per status. Enquiry rows are
+    aggregated in the database rather than loaded.
+    """
+    since = datetime.utcnow() - timedelta(days=recent_days)
+    stats = select(
+        Enquiry.machine_id,
+        func.count(Enquiry.id).label('total'),
+        func.sum(case((Enquiry.created_at >= since, 1), else_=0)).label('recent'),
+        *[func.sum(case((Enquiry.status == status, 1), else_=0)).label(status)
+          for status in ENQUIRY_STATUSES]
+    ).where(Enquiry.machine_id == machine_id) \
+        .group_by(Enquiry.machine_id) \
+        .subquery()
+
+    listings = aliased(Machine)
+    supplier_machines_count = select(func.count(listings.id)) \
+        .where(listings.supplier_id == Machine.supplier_id) \
+        .scalar_subquery()
+
+    row = db.session.query(Machine, User, supplier_machines_count,
+                           stats.c.total, stats.c.recent,
+                           *[stats.c[status] for status in ENQUIRY_STATUSES]) \
+        .join(User, User.id == Machine.supplier_id) \
+        .outerjoin(stats, stats.c.machine_id == Machine.id) \
+        .filter(Machine.id == machine_id) \
+        .first()
+    if row is None:
+        return None
+
+    machine, supplier, listing_count, total, recent = row[:5]
+    enquiry_stats = {
+        'total': total or 0,
+        'recent': recent or 0,
+        'recent_days': recent_days,
+        'by_status': {status: count or 0 for status, count in zip(ENQUIRY_STATUSES, row[5:])},
+    }
+    return MachineDetail(machine, supplier, listing_count, enquiry_stats)
+
+def load_similar_machines(machine_id, limit=6):
+    """Return the machines most similar to `machine_id`, best first (see similarity.py)"""
+    return Machine.query \
+        .join(MachineSimilarity, MachineSimilarity.similar_id == Machine.id) \
+        .filter(MachineSimilarity.machine_id == machine_id) \
+        .order_by(MachineSimilarity.score.desc()) \
+        .options(load_only(Machine.id, Machine.name, Machine.category, Machine.price_range,
+                           Machine.image_front, Machine.image_side, Machine.image_working,
+                           Machine.image_closeup)) \
+        .limit(limit) \
+        .all()
+
+def load_buyer_recommendations(buyer_id, limit=6):
+    """Return the machines recommended to a buyer, best first (see matching.py)"""
+    return Machine.query \
+        .join(BuyerRecommendation, BuyerRecommendation.machine_id == Machine.id) \
+        .filter(BuyerRecommendation.buyer_id == buyer_id) \
+        .order_by(BuyerRecommendation.score.desc()) \
+        .limit(limit) \
+        .all()
+
+def machine_enquiries_query(machine_id):
+    """Return an unordered query for a machine's enquiries with buyers loaded"""
+    return Enquiry.query \
+        .filter_by(machine_id=machine_id) \
+        .options(joinedload(Enquiry.buyer))
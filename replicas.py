@@ -0,0 +1,157 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+
+# Read replica routing.
+# DATABASE_REPLICA_URLS lists read replicas of the primary database; each
+# becomes a bind named replica_<n>. Views decorated with @replica_reads send
+# their SELECTs to one replica per request, picked round robin among the
+# healthy ones. Every other view, and every write, goes to the primary.
+#
+# Read-your-writes: once a session has written anything (a flush or a DML
+# statement), its later reads go to the primary too, and the visitor is
+# pinned to the primary for REPLICA_STICKY_SECONDS through their session
+# cookie. So the page shown after register, add_machine, create_enquiry or
+# edit_profile includes what was just saved even while the replicas lag.
+#
+# Health: a replica is checked (SELECT 1, and the replay lag on PostgreSQL)
+# when it is picked and its last check is older than REPLICA_CHECK_SECONDS.
+# One that fails, lags by more than REPLICA_MAX_LAG_SECONDS or raises a
+# connection error during a request is skipped until its next check. With
+# no healthy replica, reads go to the primary.
+#
+# Fragment cache misses render from the primary (see page_cache.py), so a
+# lagging replica never ends up cached.
+
+REPLICA_PREFIX = 'replica_'
+STICKY_KEY = 'primary_until'
+
+# Seconds the replica is behind, 0 when it has replayed everything it received
+PG_LAG = """SELECT CASE WHEN NOT pg_is_in_recovery()
+                          OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                     ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"""
+
+def _is_read(clause):
+    return clause is not None and getattr(clause, 'is_select', False) \
+        and getattr(clause, '_for_update_arg', None) is None
+
+class RoutingSession(Session):
+    """Session sending plain SELECTs to info['replica'] until it writes"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if bind is None and replica is not None and not self._flushing \
+                and not self.info.get('wrote') and _is_read(clause):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _executed(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['wrote'] = True
+
+@contextmanager
+def primary_reads(session):
+    """Send `session`'s reads to the primary inside the block"""
+    replica = session.info.pop('replica', None)
+    try:
+        yield
+    finally:
+        if replica is not None:
+            session.info['replica'] = replica
+
+def replica_reads(f):
+    """Let a read-only view query a replica"""
+    f.replica_reads = True
+    return f
+
+class ReplicaRouter:
+    """Round-robin choice among the healthy replica binds"""
+
+    def __init__(self):
+        self.db = None
+        self.keys = []
+        self._counter = itertools.count()
+        self._health = {}  # bind key -> (checked at, healthy)
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.db = db
+        self.keys = sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+                           if key.startswith(REPLICA_PREFIX))
+        self._health = {}
+        if not self.keys:
+            return
+        with app.app_context():
+            for key in self.keys:
+                event.listen(db.engines[key], 'handle_error', self._error_handler(key))
+        app.before_request(self._route_reads)
+        app.after_request(self._pin_writers)
+
+    def _error_handler(self, key):
+        def handle_error(context):
+            if context.is_disconnect:
+                self._set_health(key, False)
+        return handle_error
+
+    def _set_health(self, key, healthy):
+        with self._lock:
+            self._health[key] = (time.monotonic(), healthy)
+
+    def _check(self, key):
+        engine = self.db.engines[key]
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == 'postgresql':
+                    lag = conn.execute(text(PG_LAG)).scalar() or 0
+                else:
+                    conn.execute(text('SELECT 1'))
+                    lag = 0
+        except DBAPIError as e:
+            current_app.logger.warning('Replica %s is unavailable: %s', key, e)
+            return False
+        if lag > current_app.config['REPLICA_MAX_LAG_SECONDS']:
+            current_app.logger.warning('Replica %s is %.1fs behind', key, lag)
+            return False
+        return True
+
+    def _healthy(self, key):
+        checked_at, healthy = self._health.get(key, (None, False))
+        if checked_at is None or time.monotonic() - checked_at >= current_app.config['REPLICA_CHECK_SECONDS']:
+            healthy = self._check(key)
+            self._set_health(key, healthy)
+        return healthy
+
+    def pick(self):
+        """Return the next healthy replica engine, or None for the primary"""
+        for _ in range(len(self.keys)):
+            key = self.keys[next(self._counter) % len(self.keys)]
+            if self._healthy(key):
+                return self.db.engines[key]
+        return None
+
+    def _route_reads(self):
+        view = current_app.view_functions.get(request.endpoint)
+        if not getattr(view, 'replica_reads', False) or request.method not in ('GET', 'HEAD'):
+            return
+        if session.get(STICKY_KEY, 0) > time.time():
+            return
+        replica = self.pick()
+        if replica is not None:
+            self.db.session.info['replica'] = replica
+
+    def _pin_writers(self, response):
+        if self.db.session.info.get('wrote'):
+            session[STICKY_KEY] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+        return response
+
+replica_router = ReplicaRouter()
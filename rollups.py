@@ -0,0 +1,138 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import String, cast, delete, event, func, inspect, insert, literal, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, User, Machine, Enquiry, DailyRollup, RollupTotal
+from archive import EnquiryHistory
+
+# Daily rollups for the admin dashboard.
+# Every insert of a User, Machine or Enquiry through the ORM adds one to the
+# matching counters in daily_rollups (per UTC day of created_at) and
+# rollup_totals (all time), on the same connection and so in the same
+# transaction as the row itself. An enquiry status change moves its count
+# between statuses. The dashboard then reads a handful of counter rows
+# instead of counting whole tables.
+#
+# Rows written with Core bypass the listeners: bulk writers either call
+# add_counts() in their own transaction (machine_import.py) or leave it to
+# rebuild_rollups(), which recomputes every counter from the base tables
+# (python init_db.py rollups, datagen.py).
+
+# Metrics and their keys: users by role, machines by category, enquiries by
+# status, enquiries_by_category by machine category and
+# enquiries_by_supplier by supplier id.
+
+def _upsert(conn, model, rows, key_columns):
+    """Add each row's count to the existing counter, creating it if needed"""
+    dialect = postgresql if conn.dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(model.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={'count': model.__table__.c.count + statement.excluded.count})
+    conn.execute(statement, rows)
+
+def add_counts(conn, day, counts):
+    """Apply {(metric, key): delta} to the daily and total counters"""
+    counts = {metric_key: delta for metric_key, delta in counts.items() if delta}
+    if not counts:
+        return
+    _upsert(conn, DailyRollup, [{'metric': metric, 'key': key, 'day': day, 'count': delta}
+                                for (metric, key), delta in counts.items()], ['metric', 'key', 'day'])
+    _upsert(conn, RollupTotal, [{'metric': metric, 'key': key, 'count': delta}
+                                for (metric, key), delta in counts.items()], ['metric', 'key'])
+
+def _day(row):
+    return (row.created_at or datetime.utcnow()).date()
+
+@event.listens_for(User, 'after_insert')
+def _count_user(mapper, connection, user):
+    add_counts(connection, _day(user), {('users', user.role): 1})
+
+@event.listens_for(Machine, 'after_insert')
+def _count_machine(mapper, connection, machine):
+    add_counts(connection, _day(machine), {('machines', machine.category): 1})
+
+@event.listens_for(Enquiry, 'after_insert')
+def _count_enquiry(mapper, connection, enquiry):
+    category, supplier_id = connection.execute(
+        select(Machine.category, Machine.supplier_id).where(Machine.id == enquiry.machine_id)).one()
+    add_counts(connection, _day(enquiry), {
+        ('enquiries', enquiry.status or 'pending'): 1,
+        ('enquiries_by_category', category): 1,
+        ('enquiries_by_supplier', str(supplier_id)): 1,
+    })
+
+@event.listens_for(Enquiry, 'after_update')
+def _move_enquiry_status(mapper, connection, enquiry):
+    history = inspect(enquiry).attrs.status.history
+    if not history.has_changes() or not history.deleted:
+        return
+    counts = defaultdict(int)
+    for status in history.deleted:
+        counts[('enquiries', status)] -= 1
+    for status in history.added:
+        counts[('enquiries', status)] += 1
+    add_counts(connection, _day(enquiry), counts)
+
+def _daily_counts(metric, model, key, joins=()):
+    statement = select(func.date(model.created_at), literal(metric), cast(key, String), func.count()) \
+        .select_from(model)
+    for target, onclause in joins:
+        statement = statement.join(target, onclause)
+    return statement.where(model.created_at.isnot(None)) \
+        .group_by(func.date(model.created_at), key)
+
+def rebuild_rollups(conn=None):
+    """Recompute all counters from the base tables
+
+    Runs on `conn` if given (inside its transaction), otherwise in a
+    transaction of its own. Returns the number of daily counter rows.
+    """
+    if conn is None:
+        with db.engine.begin() as conn:
+            return rebuild_rollups(conn)
+    # Archived enquiries still count towards the all-time totals
+    machine_join = [(Machine, Machine.id == EnquiryHistory.machine_id)]
+    sources = [
+        _daily_counts('users', User, User.role),
+        _daily_counts('machines', Machine, Machine.category),
+        _daily_counts('enquiries', EnquiryHistory, EnquiryHistory.status),
+        _daily_counts('enquiries_by_category', EnquiryHistory, Machine.category, machine_join),
+        _daily_counts('enquiries_by_supplier', EnquiryHistory, Machine.supplier_id, machine_join),
+    ]
+    daily = DailyRollup.__table__
+    totals = RollupTotal.__table__
+    if conn.dialect.name == 'postgresql':
+        # Writers wait for the rebuild, then count on top of it
+        conn.execute(text("LOCK TABLE daily_rollups, rollup_totals IN EXCLUSIVE MODE"))
+    conn.execute(delete(daily))
+    conn.execute(delete(totals))
+    for source in sources:
+        conn.execute(insert(daily).from_select(['day', 'metric', 'key', 'count'], source))
+    conn.execute(insert(totals).from_select(
+        ['metric', 'key', 'count'],
+        select(daily.c.metric, daily.c.key, func.sum(daily.c.count)).group_by(daily.c.metric, daily.c.key)))
+    return conn.execute(select(func.count()).select_from(daily)).scalar()
+
+def load_totals(metrics):
+    """Return {metric: {key: count}} of all-time counters"""
+    totals = {metric: {} for metric in metrics}
+    for metric, key, count in db.session.execute(
+            select(RollupTotal.metric, RollupTotal.key, RollupTotal.count)
+            .where(RollupTotal.metric.in_(metrics))):
+        totals[metric][key] = count
+    return totals
+
+def load_daily_series(metrics, days=30):
+    """Return (days, {metric: [count per day]}) for the last `days` UTC days, summed over keys"""
+    today = datetime.utcnow().date()
+    dates = [today - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+    index = {day: position for position, day in enumerate(dates)}
+    series = {metric: [0] * days for metric in metrics}
+    for metric, day, count in db.session.execute(
+            select(DailyRollup.metric, DailyRollup.day, func.sum(DailyRollup.count))
+            .where(DailyRollup.metric.in_(metrics), DailyRollup.day >= dates[0])
+            .group_by(DailyRollup.metric, DailyRollup.day)):
+        if day in index:
+            series[metric][index[day]] = count
+    return dates, series
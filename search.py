@@ -0,0 +1,117 @@
+import re
+from sqlalchemy import DOUBLE_PRECISION, cast, func, literal_column, or_, select, table, column, text
+from models import db, Machine
+
+# Full-text search over the machine catalog.
+# SQLite uses an external-content FTS5 table kept in sync by triggers,
+# PostgreSQL uses a GIN index on a tsvector expression. Any other backend
+# falls back to ILIKE matching.
+
+SEARCH_COLUMNS = ['name', 'description', 'use_case', 'raw_material', 'ideal_industry']
+
+# Must stay identical to the expression used by the PostgreSQL GIN index,
+# otherwise the planner cannot use the index.
+PG_DOCUMENT = "to_tsvector('simple', " + " || ' ' || ".join(
+    f"coalesce({col}, '')" for col in SEARCH_COLUMNS) + ")"
+
+_column_list = ', '.join(SEARCH_COLUMNS)
+_new_values = ', '.join(f'new.{col}' for col in SEARCH_COLUMNS)
+_old_values = ', '.join(f'old.{col}' for col in SEARCH_COLUMNS)
+
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS machines_fts USING fts5(
+        {_column_list},
+        content='machines', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    f"""CREATE TRIGGER IF NOT EXISTS machines_fts_ai AFTER INSERT ON machines BEGIN
+        INSERT INTO machines_fts(rowid, {_column_list}) VALUES (new.id, {_new_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS machines_fts_ad AFTER DELETE ON machines BEGIN
+        INSERT INTO machines_fts(machines_fts, rowid, {_column_list}) VALUES ('delete', old.id, {_old_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS machines_fts_au AFTER UPDATE ON machines BEGIN
+        INSERT INTO machines_fts(machines_fts, rowid, {_column_list}) VALUES ('delete', old.id, {_old_values});
+        INSERT INTO machines_fts(rowid, {_column_list}) VALUES (new.id, {_new_values});
+    END""",
+]
+
+POSTGRES_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_machines_search ON machines USING GIN ({PG_DOCUMENT})",
+]
+
+_fts = table('machines_fts', column('rowid'))
+
+# Default catalog order, newest listings first
+CATALOG_ORDER = [(Machine.created_at, True), (Machine.id, True)]
+
+def _backend():
+    return db.engine.dialect.name
+
+def _tokenize(search):
+    """Split a search string into lowercase word tokens"""
+    return re.findall(r'\w+', search.lower())
+
+def init_search():
+    """Create the full-text index for the current database (idempotent)"""
+    backend = _backend()
+    with db.engine.begin() as conn:
+        if backend == 'sqlite':
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'machines_fts'")).first()
+            for statement in SQLITE_DDL:
+                conn.execute(text(statement))
+            if not exists:
+                # Index rows that were inserted before the triggers existed
+                conn.execute(text("INSERT INTO machines_fts(machines_fts) VALUES ('rebuild')"))
+        elif backend == 'postgresql':
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+
+def drop_search():
+    """Drop the full-text index so it can be rebuilt from scratch"""
+    backend = _backend()
+    with db.engine.begin() as conn:
+        if backend == 'sqlite':
+            for trigger in ('machines_fts_ai', 'machines_fts_ad', 'machines_fts_au'):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+            conn.execute(text("DROP TABLE IF EXISTS machines_fts"))
+        elif backend == 'postgresql':
+            conn.execute(text("DROP INDEX IF EXISTS ix_machines_search"))
+
+def apply_search(query, search):
+    """Restrict a Machine query to full-text matches
+
+    Every word in the search string must match, and each word is matched
+    as a prefix ("hydr" matches "hydraulic"). Returns the filtered query
+    and its sort keys (see pagination.py), best matches first.
+    """
+    tokens = _tokenize(search)
+    if not tokens:
+        return query, CATALOG_ORDER
+
+    backend = _backend()
+    if backend == 'sqlite':
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        fts_table = literal_column('machines_fts')
+        ranked = select(_fts.c.rowid.label('machine_id'),
+                        func.bm25(fts_table).label('rank')) \
+            .select_from(_fts) \
+            .where(fts_table.op('MATCH')(match)) \
+            .subquery()
+        # bm25() returns lower scores for better matches
+        query = query.join(ranked, ranked.c.machine_id == Machine.id)
+        return query, [(ranked.c.rank, False)] + CATALOG_ORDER
+
+    if backend == 'postgresql':
+        document = literal_column(PG_DOCUMENT)
+        tsquery = func.to_tsquery('simple', ' & '.join(f'{token}:*' for token in tokens))
+        query = query.filter(document.op('@@')(tsquery))
+        # ts_rank() returns real; as double precision the rank stored in a
+        # page cursor compares equal to the row it came from
+        rank = cast(func.ts_rank(document, tsquery), DOUBLE_PRECISION)
+        return query, [(rank, True)] + CATALOG_ORDER
+
+    for token in tokens:
+        pattern = f'%{token}%'
+        query = query.filter(or_(*[getattr(Machine, col).ilike(pattern) for col in SEARCH_COLUMNS]))
+    return query, CATALOG_ORDER
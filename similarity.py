@@ -0,0 +1,280 @@
+import heapq
+import math
+import re
+import time
+from array import array
+from collections import Counter, defaultdict
+import numpy as np
+from sqlalchemy import delete, func, insert, select, text, union_all
+from models import db, Machine, SimilarityTerm, MachineTerm, MachineSimilarity
+
+# "Similar machines" index.
+# Every machine is turned into a sparse TF-IDF vector over the text fields
+# below, keeping only its TERMS_PER_MACHINE heaviest terms. The vocabulary
+# (with idf), the vectors and each machine's TOP_K nearest neighbours by
+# cosine similarity are stored in similarity_terms, machine_terms and
+# machine_similarities, so the detail page needs one indexed lookup.
+#
+# build_index() recomputes everything with NumPy (python init_db.py
+# similarity). Neighbours are found through posting lists capped at the
+# POSTING_CAP heaviest machines per term, which keeps the build roughly
+# linear in the catalog size; very common terms therefore only connect
+# machines where they carry a lot of weight.
+#
+# index_machine() adds a single new machine without touching the rest: it
+# uses the vocabulary of the last build, scores the same capped postings in
+# SQL and links the machine into its neighbours' lists where it beats their
+# weakest entry. Terms unseen at the last build are ignored until the next
+# full build.
+
+SIMILARITY_FIELDS = ['name', 'category', 'use_case', 'description', 'raw_material', 'ideal_industry']
+
+TOP_K = 10
+TERMS_PER_MACHINE = 12
+POSTING_CAP = 200
+MIN_SCORE = 0.05
+
+# Terms in fewer than MIN_DF machines or more than MAX_DF of them are dropped
+MIN_DF = 2
+MAX_DF = 0.5
+
+# Machines scored per NumPy step; peak memory grows linearly with it
+CHUNK_SIZE = 1000
+BATCH_SIZE = 10_000
+
+STOPWORDS = frozenset('a an and are as at be by for from in into is it its of on or per '
+                      'the to with'.split())
+
+def tokenize(document):
+    return [token for token in re.findall(r'[a-z][a-z0-9]+', document.lower())
+            if token not in STOPWORDS and len(token) <= 100]
+
+def _document(values):
+    return ' '.join(value for value in values if value)
+
+def tfidf_vector(tokens, vocabulary):
+    """Return the heaviest (term_id, weight) pairs of a token list, L2-normalised
+
+    `vocabulary` maps terms to (term_id, idf); other tokens are ignored.
+    """
+    counts = Counter(token for token in tokens if token in vocabulary)
+    weighted = [(vocabulary[term][0], (1 + math.log(count)) * vocabulary[term][1])
+                for term, count in counts.items()]
+    weighted = heapq.nlargest(TERMS_PER_MACHINE, weighted, key=lambda pair: pair[1])
+    norm = math.sqrt(sum(weight * weight for _, weight in weighted))
+    return [(term_id, weight / norm) for term_id, weight in weighted] if norm else []
+
+def _machine_documents():
+    """Yield (machine_id, tokens) for the whole catalog, streamed in id order"""
+    columns = [getattr(Machine, field) for field in SIMILARITY_FIELDS]
+    statement = select(Machine.id, *columns).order_by(Machine.id)
+    with db.engine.connect() as conn:
+        for row in conn.execution_options(yield_per=BATCH_SIZE).execute(statement):
+            yield row[0], tokenize(_document(row[1:]))
+
+def posting_lists(indptr, terms, weights, cap):
+    """Invert CSR vectors into per-term posting lists, heaviest first
+
+    Returns (rows, weights, start): the postings of term t are
+    rows[start[t]:start[t+1]], at most `cap` of them.
+    """
+    row_of_entry = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    n_terms = int(terms.max()) + 1 if len(terms) else 1
+    order = np.lexsort((-weights, terms))
+    sorted_terms = terms[order]
+    term_start = np.searchsorted(sorted_terms, np.arange(n_terms))
+    keep = np.arange(len(order)) - term_start[sorted_terms] < cap
+    post_start = np.searchsorted(sorted_terms[keep], np.arange(n_terms + 1))
+    return row_of_entry[order][keep], weights[order][keep], post_start
+
+def _nearest_neighbours(indptr, terms, weights):
+    """Return (neighbours, scores) arrays of shape (machines, TOP_K)
+
+    The vectors are given in CSR form: row i holds terms[indptr[i]:indptr[i+1]].
+    Missing neighbours are -1.
+    """
+    n = len(indptr) - 1
+    neighbours = np.full((n, TOP_K), -1, dtype=np.int32)
+    scores = np.zeros((n, TOP_K), dtype=np.float32)
+    if not len(terms):
+        return neighbours, scores
+    row_of_entry = np.repeat(np.arange(n, dtype=np.int32), np.diff(indptr))
+
+    # Posting lists: entries grouped by term, heaviest first, capped
+    post_rows, post_weights, post_start = posting_lists(indptr, terms, weights, POSTING_CAP)
+    post_len = np.diff(post_start)
+
+    for first in range(0, n, CHUNK_SIZE):
+        last = min(first + CHUNK_SIZE, n)
+        entries = slice(indptr[first], indptr[last])
+        entry_terms = terms[entries]
+        lengths = post_len[entry_terms]
+        total = int(lengths.sum())
+        if not total:
+            continue
+        # Pair every entry of the chunk with every posting of its term
+        ends = np.cumsum(lengths)
+        positions = np.arange(total) - np.repeat(ends - lengths - post_start[entry_terms], lengths)
+        rows = np.repeat(row_of_entry[entries], lengths)
+        candidates = post_rows[positions]
+        products = np.repeat(weights[entries], lengths) * post_weights[positions]
+        other = candidates != rows
+        keys = (rows[other] - first).astype(np.int64) * n + candidates[other]
+        del positions, rows, candidates
+
+        # Sum the products per (row, candidate) pair, then keep each row's best
+        pairs, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=products[other]).astype(np.float32)
+        local = (pairs // n).astype(np.int32)
+        found = (pairs % n).astype(np.int32)
+        best = np.lexsort((-sums, local))
+        local, found, sums = local[best], found[best], sums[best]
+        rank = np.arange(len(local)) - np.searchsorted(local, local)
+        top = (rank < TOP_K) & (sums >= MIN_SCORE)
+        neighbours[first + local[top], rank[top]] = found[top]
+        scores[first + local[top], rank[top]] = sums[top]
+    return neighbours, scores
+
+def _insert_rows(conn, table, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.execute(insert(table), batch)
+            batch = []
+    if batch:
+        conn.execute(insert(table), batch)
+
+def _write_index(vocabulary, machine_ids, indptr, terms, weights, neighbours, scores):
+    """Replace the stored index in one transaction, so readers never see it half built"""
+    row_of_entry = np.repeat(np.arange(len(machine_ids)), np.diff(indptr))
+    entry_machines = machine_ids[row_of_entry].tolist()
+    has_neighbour = neighbours >= 0
+    source_rows, _ = np.nonzero(has_neighbour)
+    with db.engine.begin() as conn:
+        if db.engine.dialect.name == 'postgresql':
+            conn.execute(text("TRUNCATE machine_similarities, machine_terms, similarity_terms"))
+        else:
+            for model in (MachineSimilarity, MachineTerm, SimilarityTerm):
+                conn.execute(delete(model.__table__))
+        _insert_rows(conn, SimilarityTerm.__table__,
+                     ({'id': term_id, 'term': term, 'idf': idf}
+                      for term, (term_id, idf) in vocabulary.items()))
+        _insert_rows(conn, MachineTerm.__table__,
+                     ({'machine_id': machine_id, 'term_id': term_id, 'weight': weight}
+                      for machine_id, term_id, weight in zip(entry_machines, terms.tolist(), weights.tolist())))
+        _insert_rows(conn, MachineSimilarity.__table__,
+                     ({'machine_id': machine_id, 'similar_id': similar_id, 'score': score}
+                      for machine_id, similar_id, score in zip(
+                          machine_ids[source_rows].tolist(),
+                          machine_ids[neighbours[has_neighbour]].tolist(),
+                          scores[has_neighbour].tolist())))
+    return int(has_neighbour.sum())
+
+def build_index():
+    """Rebuild the whole similarity index from the catalog
+
+    Returns a dict of build statistics.
+    """
+    started = time.perf_counter()
+
+    # Pass 1: document frequencies
+    document_frequency = Counter()
+    n_machines = 0
+    for _, tokens in _machine_documents():
+        document_frequency.update(set(tokens))
+        n_machines += 1
+    max_df = max(MIN_DF, int(MAX_DF * n_machines))
+    kept = sorted(term for term, df in document_frequency.items() if MIN_DF <= df <= max_df)
+    vocabulary = {term: (term_id, math.log((1 + n_machines) / (1 + document_frequency[term])) + 1)
+                  for term_id, term in enumerate(kept, start=1)}
+    del document_frequency
+
+    # Pass 2: sparse vectors in CSR form
+    machine_ids = array('i')
+    indptr = array('q', [0])
+    terms = array('i')
+    weights = array('f')
+    for machine_id, tokens in _machine_documents():
+        for term_id, weight in tfidf_vector(tokens, vocabulary):
+            terms.append(term_id)
+            weights.append(weight)
+        machine_ids.append(machine_id)
+        indptr.append(len(terms))
+    machine_ids = np.frombuffer(machine_ids, dtype=np.int32)
+    indptr = np.frombuffer(indptr, dtype=np.int64)
+    terms = np.frombuffer(terms, dtype=np.int32)
+    weights = np.frombuffer(weights, dtype=np.float32)
+    vectorized = time.perf_counter()
+
+    neighbours, scores = _nearest_neighbours(indptr, terms, weights)
+    scored = time.perf_counter()
+
+    links = _write_index(vocabulary, machine_ids, indptr, terms, weights, neighbours, scores)
+    finished = time.perf_counter()
+    return {
+        'machines': n_machines,
+        'terms': len(vocabulary),
+        'links': links,
+        'vectorize_seconds': round(vectorized - started, 2),
+        'neighbours_seconds': round(scored - vectorized, 2),
+        'write_seconds': round(finished - scored, 2),
+        'total_seconds': round(finished - started, 2),
+    }
+
+def index_machine(machine):
+    """Add a new (flushed) machine to the index in the current session
+
+    The caller commits. Does nothing until a full build has created the
+    vocabulary.
+    """
+    tokens = tokenize(_document(getattr(machine, field) for field in SIMILARITY_FIELDS))
+    if not tokens:
+        return
+    vocabulary = {term: (term_id, idf) for term_id, term, idf in db.session.execute(
+        select(SimilarityTerm.id, SimilarityTerm.term, SimilarityTerm.idf)
+        .where(SimilarityTerm.term.in_(set(tokens))))}
+    vector = tfidf_vector(tokens, vocabulary)
+    if not vector:
+        return
+    db.session.execute(insert(MachineTerm), [
+        {'machine_id': machine.id, 'term_id': term_id, 'weight': weight} for term_id, weight in vector])
+
+    # Score the same capped posting lists the full build uses
+    postings = [select(MachineTerm.machine_id, MachineTerm.term_id, MachineTerm.weight)
+                .where(MachineTerm.term_id == term_id)
+                .order_by(MachineTerm.weight.desc())
+                .limit(POSTING_CAP).subquery().select()
+                for term_id, _ in vector]
+    query_weights = dict(vector)
+    totals = defaultdict(float)
+    for machine_id, term_id, weight in db.session.execute(union_all(*postings)):
+        if machine_id != machine.id:
+            totals[machine_id] += weight * query_weights[term_id]
+    nearest = [(machine_id, score) for machine_id, score in
+               heapq.nlargest(TOP_K, totals.items(), key=lambda pair: pair[1]) if score >= MIN_SCORE]
+    if not nearest:
+        return
+    db.session.execute(insert(MachineSimilarity), [
+        {'machine_id': machine.id, 'similar_id': machine_id, 'score': score} for machine_id, score in nearest])
+
+    # Link the new machine back from neighbours whose lists it improves
+    current = {machine_id: (count, weakest) for machine_id, count, weakest in db.session.execute(
+        select(MachineSimilarity.machine_id, func.count(), func.min(MachineSimilarity.score))
+        .where(MachineSimilarity.machine_id.in_([machine_id for machine_id, _ in nearest]))
+        .group_by(MachineSimilarity.machine_id))}
+    backlinks = []
+    for machine_id, score in nearest:
+        count, weakest = current.get(machine_id, (0, None))
+        if count >= TOP_K:
+            if score <= weakest:
+                continue
+            weakest_id = db.session.execute(
+                select(MachineSimilarity.similar_id)
+                .where(MachineSimilarity.machine_id == machine_id)
+                .order_by(MachineSimilarity.score, MachineSimilarity.similar_id).limit(1)).scalar()
+            db.session.execute(delete(MachineSimilarity).where(
+                MachineSimilarity.machine_id == machine_id, MachineSimilarity.similar_id == weakest_id))
+        backlinks.append({'machine_id': machine_id, 'similar_id': machine.id, 'score': score})
+    if backlinks:
+        db.session.execute(insert(MachineSimilarity), backlinks)
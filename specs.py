@@ -0,0 +1,207 @@
+import re
+from sqlalchemy import bindparam, event, select, update
+from models import db, Machine
+from search import CATALOG_ORDER
+
+# Numeric machine specifications.
+# price_range, power_requirement and production_capacity are free text typed
+# by suppliers ('₹15,00,000 - ₹25,00,000', '440V, 3 Phase, 15 kW',
+# '500-1000 units per 8-hour shift'). The parsers below turn them into the
+# indexed numeric columns price_min, price_max, power_kw and
+# capacity_per_shift, which the catalog filters and sorts on. The columns
+# are filled whenever a Machine is inserted or updated through the ORM;
+# backfill_specs() fills existing rows. Unparseable values are left NULL.
+
+UNIT_MULTIPLIERS = {
+    'crore': 10_000_000, 'crores': 10_000_000, 'cr': 10_000_000,
+    'lakh': 100_000, 'lakhs': 100_000, 'lac': 100_000, 'lacs': 100_000, 'l': 100_000,
+    'thousand': 1_000, 'k': 1_000,
+}
+
+KW_PER_HP = 0.7457
+
+# Hours in a shift when a capacity is quoted per hour and no shift length is given
+SHIFT_HOURS = 8
+
+_AMOUNT = re.compile(r'(\d[\d,]*(?:\.\d+)?)\s*(crores?|cr|lakhs?|lacs?|thousand|l|k)?\b', re.IGNORECASE)
+_POWER = re.compile(r'(\d+(?:\.\d+)?)\s*(kw|hp|w)\b', re.IGNORECASE)
+_CAPACITY = re.compile(r'(\d[\d,]*)(?:\s*(?:-|to)\s*(\d[\d,]*))?\s*(?:units?|pieces?|pcs|nos?|bags?|kg|kgs|bottles?|packets?)?'
+                       r'\s*(?:/|per)\s*(?:(\d+)[\s-]*(?:hours?|hrs?)[\s-]*)?(shift|hour|hr|day)\b', re.IGNORECASE)
+
+def _number(value):
+    return float(value.replace(',', ''))
+
+def parse_amount(value):
+    """Parse a rupee amount such as '₹15,00,000', '15 lakh' or '1.2 Cr'"""
+    if not value:
+        return None
+    match = _AMOUNT.search(value)
+    if not match:
+        return None
+    amount = _number(match.group(1)) * UNIT_MULTIPLIERS.get((match.group(2) or '').lower(), 1)
+    return int(round(amount))
+
+def parse_price_range(value):
+    """Return (price_min, price_max) in rupees from a price range string
+
+    Handles '₹15,00,000 - ₹25,00,000', '₹8-12 lakh', '1.5 Cr' and single
+    amounts; a unit written only after the last number also applies to the
+    small bare numbers before it. Stray small numbers ('for 2 units') are
+    ignored. Returns (None, None) if no amount is found.
+    """
+    if not value:
+        return None, None
+    matches = _AMOUNT.findall(value)
+    if not matches:
+        return None, None
+    trailing_unit = (matches[-1][1] or '').lower()
+    amounts = []
+    for number, unit in matches:
+        number = _number(number)
+        if not unit and number < 1000:
+            unit = trailing_unit
+        amounts.append(int(round(number * UNIT_MULTIPLIERS.get(unit.lower(), 1))))
+    plausible = [amount for amount in amounts if amount >= 1000]
+    amounts = plausible or amounts
+    return min(amounts), max(amounts)
+
+def parse_power_kw(value):
+    """Return the largest power rating in kW from e.g. '440V, 3 Phase, 15 kW' or '20 HP'"""
+    if not value:
+        return None
+    ratings = []
+    for number, unit in _POWER.findall(value):
+        unit = unit.lower()
+        kw = float(number) * (KW_PER_HP if unit == 'hp' else 0.001 if unit == 'w' else 1)
+        ratings.append(round(kw, 2))
+    return max(ratings) if ratings else None
+
+def parse_capacity_per_shift(value):
+    """Return the guaranteed output per shift from e.g. '500-1000 units per 8-hour shift'
+
+    The lower end of a range is used. Hourly rates are scaled to a shift of
+    SHIFT_HOURS; a daily figure is taken as one shift.
+    """
+    if not value:
+        return None
+    match = _CAPACITY.search(value)
+    if not match:
+        return None
+    low, _, hours, period = match.groups()
+    amount = _number(low)
+    if period.lower() in ('hour', 'hr'):
+        amount *= int(hours) if hours else SHIFT_HOURS
+    return int(amount)
+
+def machine_specs(price_range, power_requirement, production_capacity):
+    """Return the numeric spec columns for the given free-text fields"""
+    price_min, price_max = parse_price_range(price_range)
+    return {
+        'price_min': price_min,
+        'price_max': price_max,
+        'power_kw': parse_power_kw(power_requirement),
+        'capacity_per_shift': parse_capacity_per_shift(production_capacity),
+    }
+
+@event.listens_for(Machine, 'before_insert')
+@event.listens_for(Machine, 'before_update')
+def _fill_specs(mapper, connection, machine):
+    for column, value in machine_specs(machine.price_range, machine.power_requirement,
+                                       machine.production_capacity).items():
+        setattr(machine, column, value)
+
+def backfill_specs(conn=None, batch_size=5000):
+    """Re-parse the numeric spec columns of every machine, in id order
+
+    Runs on `conn` if given (inside its transaction), otherwise in one
+    transaction per batch. Returns the number of rows updated.
+    """
+    table = Machine.__table__
+    statement = update(table).where(table.c.id == bindparam('machine_id')).values(
+        price_min=bindparam('price_min'), price_max=bindparam('price_max'),
+        power_kw=bindparam('power_kw'), capacity_per_shift=bindparam('capacity_per_shift'))
+    last_id = 0
+    updated = 0
+    while True:
+        batch_query = select(table.c.id, table.c.price_range, table.c.power_requirement,
+                             table.c.production_capacity) \
+            .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+        if conn is not None:
+            rows = conn.execute(batch_query).all()
+        else:
+            with db.engine.connect() as read_conn:
+                rows = read_conn.execute(batch_query).all()
+        if not rows:
+            return updated
+        params = [dict(machine_specs(price, power, capacity), machine_id=machine_id)
+                  for machine_id, price, power, capacity in rows]
+        if conn is not None:
+            conn.execute(statement, params)
+        else:
+            with db.engine.begin() as write_conn:
+                write_conn.execute(statement, params)
+        updated += len(rows)
+        last_id = rows[-1][0]
+
+# Catalog filters and sorting
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+# ?min_price=&max_price= accept amounts like '1000000' or '10 lakh'
+RANGE_PARAMS = {
+    'min_price': parse_amount,
+    'max_price': parse_amount,
+    'min_power': _parse_float,
+    'max_power': _parse_float,
+    'min_capacity': _parse_float,
+}
+
+# sort key -> (label, sort keys for paginate()); machines without a value
+# for the sort column are left out of those orderings
+SORT_OPTIONS = {
+    'newest': ('Newest first', CATALOG_ORDER),
+    'price_asc': ('Price: low to high', [(Machine.price_min, False), (Machine.id, False)]),
+    'price_desc': ('Price: high to low', [(Machine.price_max, True), (Machine.id, True)]),
+    'power_asc': ('Power: lowest first', [(Machine.power_kw, False), (Machine.id, False)]),
+    'capacity_desc': ('Capacity: highest first', [(Machine.capacity_per_shift, True), (Machine.id, True)]),
+}
+
+def parse_ranges(args):
+    """Return the valid range filters from request args as {param: number}"""
+    ranges = {}
+    for param, parse in RANGE_PARAMS.items():
+        value = parse(args.get(param)) if args.get(param) else None
+        if value is not None:
+            ranges[param] = value
+    return ranges
+
+def apply_ranges(query, ranges):
+    """Filter a Machine query by parsed range filters
+
+    A machine matches a price range when its own price range overlaps it.
+    """
+    if 'min_price' in ranges:
+        query = query.filter(Machine.price_max >= ranges['min_price'])
+    if 'max_price' in ranges:
+        query = query.filter(Machine.price_min <= ranges['max_price'])
+    if 'min_power' in ranges:
+        query = query.filter(Machine.power_kw >= ranges['min_power'])
+    if 'max_power' in ranges:
+        query = query.filter(Machine.power_kw <= ranges['max_power'])
+    if 'min_capacity' in ranges:
+        query = query.filter(Machine.capacity_per_shift >= ranges['min_capacity'])
+    return query
+
+def apply_sort(query, sort):
+    """Return (query, sort_keys) for a SORT_OPTIONS key, or None if unknown"""
+    if sort not in SORT_OPTIONS:
+        return None
+    sort_keys = SORT_OPTIONS[sort][1]
+    column = sort_keys[0][0]
+    if column is not Machine.created_at:
+        query = query.filter(column.isnot(None))
+    return query, sort_keys
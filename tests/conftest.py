@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+# The application modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from datagen import generate  # noqa: E402
+from models import db, User  # noqa: E402
+
+@pytest.fixture
+def app(tmp_path):
+    """App on a fresh SQLite database holding a small generated dataset"""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'AUTO_CREATE_SCHEMA': True,
+        'PAGE_CACHE_BACKEND': 'none',
+        'PAGE_CACHE_DIR': str(tmp_path / 'page_cache'),
+        'IMAGE_CACHE_DIR': str(tmp_path / 'image_cache'),
+        'IMPORT_FOLDER': str(tmp_path / 'imports'),
+        'IMPORT_WATCHDOG_ENABLED': False,
+    })
+    with app.app_context():
+        generate(suppliers=5, buyers=20, machines=200, enquiries=1000, batch_size=1000, seed=1)
+        db.session.add(User(name='Admin', email='admin@example.com', role='admin',
+                            password_hash=generate_password_hash('password')))
+        db.session.commit()
+        db.session.remove()
+    return app
+
+@pytest.fixture
+def login(app):
+    """Return a function signing a test client in as a user, like login() does"""
+    def login(client, user):
+        with client.session_transaction() as sess:
+            sess.clear()
+            sess.update({'user_id': user.id, 'user_name': user.name, 'user_role': user.role,
+                         'user_profile_image': user.profile_image, 'user_version': user.version})
+    return login
@@ -0,0 +1,69 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert, select
+
+from models import db, User, Machine, Enquiry
+
+# The dashboards and the enquiry inbox must issue the same number of SQL
+# statements however many enquiries there are: a count that grows with the
+# data means relationships are lazy-loaded per row.
+
+def count_statements(app, client, url):
+    """Return how many statements a GET of `url` executes"""
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', on_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', on_execute)
+    assert response.status_code == 200
+    return len(statements)
+
+def add_enquiries(app, supplier, buyer, count):
+    """Insert `count` enquiries, half on `supplier`'s machines and half by `buyer`"""
+    rng = random.Random(2)
+    with app.app_context():
+        supplier_machines = db.session.scalars(select(Machine.id).where(Machine.supplier_id == supplier.id)).all()
+        machines = db.session.scalars(select(Machine.id)).all()
+        buyers = db.session.scalars(select(User.id).where(User.role == 'buyer')).all()
+        now = datetime.utcnow()
+        rows = [{
+            'buyer_id': buyer.id if i % 2 else rng.choice(buyers),
+            'machine_id': rng.choice(machines) if i % 2 else rng.choice(supplier_machines),
+            'message': f'Enquiry {i}', 'budget': '5 lakh', 'location': 'Pune',
+            'production_need': '100 units per shift',
+            'status': rng.choice(['pending', 'responded', 'closed']),
+            'created_at': now - timedelta(minutes=i),
+        } for i in range(count)]
+        with db.engine.begin() as conn:
+            conn.execute(insert(Enquiry), rows)
+
+@pytest.mark.parametrize('role, url', [
+    ('supplier', '/dashboard'),
+    ('buyer', '/dashboard'),
+    ('admin', '/dashboard'),
+    ('supplier', '/enquiries'),
+])
+def test_statement_count_does_not_grow_with_enquiries(app, login, role, url):
+    with app.app_context():
+        supplier = User.query.filter_by(role='supplier').first()
+        buyer = User.query.filter_by(role='buyer').first()
+        admin = User.query.filter_by(role='admin').first()
+        user = {'supplier': supplier, 'buyer': buyer, 'admin': admin}[role]
+    client = app.test_client()
+    login(client, user)
+
+    client.get(url)  # warm-up: one-off lookups are not part of the per-request cost
+    before = count_statements(app, client, url)
+    add_enquiries(app, supplier, buyer, 2000)
+    after = count_statements(app, client, url)
+
+    assert after == before
@@ -0,0 +1,49 @@
+import re
+
+from sqlalchemy import event
+
+from models import db, User
+from pagination import paginate
+from queries import ENQUIRY_ORDER, load_buyer_enquiries, load_recent_enquiries, supplier_enquiries_query
+
+# The dashboard enquiry queries must be answered from the indexes added by
+# migration 1 rather than by scanning the enquiries table (SQLite plans).
+
+def query_plans(load):
+    """Run `load` and return the EXPLAIN QUERY PLAN details of each statement it executes"""
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', on_execute)
+    try:
+        load()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', on_execute)
+    conn = db.session.connection()
+    return [' | '.join(row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters))
+            for statement, parameters in statements]
+
+def assert_uses_index(plans, index):
+    plan = next(plan for plan in plans if 'enquiries' in plan)
+    assert f'USING INDEX {index}' in plan or f'USING COVERING INDEX {index}' in plan, plan
+    # An index-ordered scan (SCAN ... USING INDEX) is fine, a table scan is not
+    assert not re.search(r'SCAN enquiries(?! USING)', plan), plan
+
+def test_supplier_inbox_uses_machine_index(app):
+    with app.app_context():
+        supplier = User.query.filter_by(role='supplier').first()
+        plans = query_plans(lambda: paginate(supplier_enquiries_query(supplier.id), ENQUIRY_ORDER, 20))
+        assert_uses_index(plans, 'ix_enquiries_machine_id_created_at')
+
+def test_buyer_dashboard_uses_buyer_index(app):
+    with app.app_context():
+        buyer = User.query.filter_by(role='buyer').first()
+        plans = query_plans(lambda: load_buyer_enquiries(buyer.id))
+        assert_uses_index(plans, 'ix_enquiries_buyer_id_created_at')
+
+def test_recent_enquiries_use_created_at_index(app):
+    with app.app_context():
+        plans = query_plans(lambda: load_recent_enquiries(10))
+        assert_uses_index(plans, 'ix_enquiries_created_at_id')
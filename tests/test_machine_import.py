@@ -0,0 +1,69 @@
+import csv
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from machine_import import (MACHINE_FIELDS, CHUNK_ROWS, ImportTakenOver, claim_stale_jobs, create_job,
+                            run_import, _commit_chunk)
+from models import db, User, Machine, ImportJob
+
+# An import whose worker was recycled mid-file is left 'running'. Once its
+# updated_at is older than IMPORT_STALE_SECONDS it is claimed once and
+# resumed after its last committed row, without importing rows twice.
+
+ROWS = CHUNK_ROWS * 2 + 500
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(MACHINE_FIELDS)
+        for n in range(rows):
+            values = {field: f'{field[:4]}{n}' for field in MACHINE_FIELDS}
+            values['image_front'] = 'uploads/machine.jpg'
+            writer.writerow([values[field] for field in MACHINE_FIELDS])
+
+def machine_count():
+    return db.session.scalar(select(func.count()).select_from(Machine))
+
+@pytest.fixture
+def stalled_job(app, tmp_path):
+    """A job that committed its first chunk, then lost its worker"""
+    path = tmp_path / 'machines.csv'
+    write_csv(path, ROWS)
+    with app.app_context():
+        supplier = db.session.scalars(select(User).filter_by(role='supplier')).first()
+        job = create_job(supplier.id, 'machines.csv', str(path))
+        _commit_chunk(job.id, [], [], 0, CHUNK_ROWS, status='running')
+        job.updated_at = datetime.utcnow() - timedelta(seconds=app.config['IMPORT_STALE_SECONDS'] + 60)
+        db.session.commit()
+        job_id = job.id
+        db.session.remove()
+    return job_id
+
+def test_stale_job_is_claimed_once_and_resumed(app, stalled_job):
+    with app.app_context():
+        before = machine_count()
+        stale_seconds = app.config['IMPORT_STALE_SECONDS']
+        assert claim_stale_jobs(stale_seconds) == [stalled_job]
+        assert claim_stale_jobs(stale_seconds) == []
+        assert run_import(stalled_job) == 'done'
+        job = db.session.get(ImportJob, stalled_job)
+        assert (job.rows_done, job.imported) == (ROWS, ROWS - CHUNK_ROWS)
+        assert machine_count() == before + ROWS - CHUNK_ROWS
+
+def test_recent_job_is_not_claimed(app, stalled_job):
+    with app.app_context():
+        job = db.session.get(ImportJob, stalled_job)
+        job.updated_at = datetime.utcnow()
+        db.session.commit()
+        assert claim_stale_jobs(app.config['IMPORT_STALE_SECONDS']) == []
+
+def test_superseded_runner_commits_nothing(app, stalled_job):
+    with app.app_context():
+        before = machine_count()
+        assert run_import(stalled_job) == 'done'
+        with pytest.raises(ImportTakenOver):
+            _commit_chunk(stalled_job, [], [], CHUNK_ROWS, CHUNK_ROWS * 2)
+        assert db.session.get(ImportJob, stalled_job).rows_done == ROWS
+        assert machine_count() == before + ROWS - CHUNK_ROWS